@@ -0,0 +1,6 @@
+"""Performance benchmarks for ``setuptools-coconut`` (not shipped with the package).
+
+Run them from the root of the repository, e.g.::
+
+    python -m benchmarks.build --help
+"""
@@ -0,0 +1,136 @@
+"""Build benchmarks for synthetic projects (see :mod:`benchmarks.project`).
+
+Usage::
+
+    python -m benchmarks.build --modules 200 --output results.json
+    python -m benchmarks.build --modules 200 --compare results.json
+
+Measured steps:
+
+- ``cold_build``: :func:`~setuptools_coconut.api.compile` with no previous build.
+- ``warm_build``: the same, when nothing changed since the last build.
+- ``incremental_build``: the same, after modifying a single module.
+- ``compiled_files_first``: all the calls ``setuptools`` does to
+  :func:`~setuptools_coconut.api.compiled_files` during a new (up-to-date) build,
+  one per package directory.
+- ``compiled_files_cached``: the same calls, once the results are in memory.
+- ``staging_cold``/``staging_warm``: :class:`~setuptools_coconut.api.OtherFiles`
+  placing the data files in an empty/synchronised directory.
+"""
+import argparse
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from shutil import rmtree
+from typing import Any, Dict, Iterator, List, Optional
+
+from setuptools_coconut import api
+from setuptools_coconut.config import CACHE_ENV_VAR, CoconutConfig
+
+from .project import ProjectSpec, generate, package_dirs, touch_module
+from .results import Timing, load, measure, report, save, table
+
+
+@contextmanager
+def project_env(root: Path) -> Iterator[None]:
+    """Run from the project root, with an isolated user cache"""
+    cwd, cache = os.getcwd(), os.environ.get(CACHE_ENV_VAR)
+    os.chdir(root)
+    os.environ[CACHE_ENV_VAR] = str(root / ".cache")
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        if cache is None:
+            os.environ.pop(CACHE_ENV_VAR, None)
+        else:
+            os.environ[CACHE_ENV_VAR] = cache
+
+
+def run(root: Path, spec: ProjectSpec, repeat: int = 3) -> Dict[str, Timing]:
+    config = CoconutConfig.from_file(root / "pyproject.toml")
+    assert config is not None
+    project = str(root)
+    build_dirs = [Path("build", d.relative_to(root)) for d in package_dirs(root, spec)]
+
+    def clean():
+        rmtree(root / "build", ignore_errors=True)
+        rmtree(root / ".cache", ignore_errors=True)
+
+    def build():
+        api.compile(project, config)
+
+    def compiled_files():
+        for directory in build_dirs:
+            list(api.compiled_files(str(directory)))
+
+    def new_session():
+        api.session.cache_clear()
+
+    def stage():
+        for src in config.src:
+            other = api.OtherFiles(
+                project, src, exclude=config.exclude, staging=config.staging
+            )
+            list(other.link_or_copy(str(root / "staging" / src)))
+
+    def clean_staging():
+        rmtree(root / "staging", ignore_errors=True)
+
+    results = {}
+    with project_env(root):
+        results["cold_build"] = measure(build, repeat, setup=clean)
+        results["warm_build"] = measure(build, repeat)
+        results["incremental_build"] = measure(
+            build, repeat, setup=lambda: touch_module(root, spec)
+        )
+        results["compiled_files_first"] = measure(
+            compiled_files, repeat, setup=new_session
+        )
+        results["compiled_files_cached"] = measure(compiled_files, repeat)
+        results["staging_cold"] = measure(stage, repeat, setup=clean_staging)
+        results["staging_warm"] = measure(stage, repeat)
+    return results
+
+
+def parser() -> argparse.ArgumentParser:
+    cli = argparse.ArgumentParser(prog="python -m benchmarks.build")
+    project = cli.add_argument_group("project")
+    for field, default in ProjectSpec._field_defaults.items():
+        flag = "--" + field.replace("_", "-")
+        project.add_argument(flag, type=int, default=default, metavar="N")
+    options = cli.add_argument_group("[tool.coconut] options")
+    options.add_argument("--engine", default="subprocess")
+    options.add_argument("--staging", default="auto")
+    options.add_argument("--processes", default="sys")
+    options.add_argument("--cache", action="store_true")
+    cli.add_argument("--repeat", type=int, default=3)
+    cli.add_argument("--dir", type=Path, help="keep the generated project here")
+    cli.add_argument("--output", type=Path, help="save results in a JSON file")
+    cli.add_argument("--compare", type=Path, help="results of a previous run")
+    return cli
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parser().parse_args(argv)
+    spec = ProjectSpec(*(getattr(args, f) for f in ProjectSpec._fields))
+    options: Dict[str, Any] = {
+        "engine": args.engine,
+        "staging": args.staging,
+        "processes": args.processes,
+        "cache": args.cache,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        root = generate(args.dir or Path(tmp, "project"), spec, options)
+        results = run(root, spec, args.repeat)
+
+    params = {"spec": spec._asdict(), "options": options, "repeat": args.repeat}
+    contents = report("build", params, results)
+    print(table(contents, args.compare and load(args.compare)))
+    if args.output:
+        save(args.output, contents)
+
+
+if __name__ == "__main__":
+    main()
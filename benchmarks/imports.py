@@ -0,0 +1,148 @@
+"""Import-time benchmarks for the code generated from synthetic projects
+(see :mod:`benchmarks.project`), to compare compiler options.
+
+Usage::
+
+    python -m benchmarks.imports --modules 50 --output default.json
+    python -m benchmarks.imports --modules 50 --no-tco --compare default.json
+
+The project is compiled with :func:`~setuptools_coconut.api.compile` and the
+generated packages are copied into an isolated directory (similar to
+``site-packages``). Each module is then imported in a fresh interpreter, with
+``PYTHONDONTWRITEBYTECODE`` (so the imports are always "cold", unless the ``.pyc``
+files are produced by the ``bytecode`` option, as they would be in a wheel).
+
+Measured steps:
+
+- ``import_all``: importing all the generated modules in the same interpreter.
+- ``import:<module>``: importing each module by itself, besides the wall time of
+  the ``import`` statement, the median ``self`` and ``cumulative`` times reported
+  by ``python -X importtime`` (in microseconds) are included.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from shutil import copytree
+from typing import Any, Dict, List, Optional
+
+from setuptools_coconut import api, bytecode
+from setuptools_coconut.config import CoconutConfig
+
+from .build import project_env
+from .project import ProjectSpec, generate
+from .results import Timing, load, report, save, table
+
+SCRIPT = """\
+import time
+start = time.perf_counter()
+{imports}
+print(time.perf_counter() - start)
+"""
+
+
+def install(root: Path, config: CoconutConfig, target: Path) -> List[str]:
+    """Compile the project and copy the generated packages to ``target``.
+    Return the names of the generated modules.
+    """
+    with project_env(root):
+        api.compile(str(root), config)
+    modules = []
+    for src, dest in config.build_paths().items():
+        copytree(root / dest, target, dirs_exist_ok=True)
+        for file in sorted((root / src).glob("**/*.coco")):
+            parts = file.relative_to(root / src).with_suffix("").parts
+            modules.append(".".join(parts[:-1] if parts[-1] == "__init__" else parts))
+    if config.bytecode:
+        files = [str(f) for f in target.glob("**/*.py")]
+        bytecode.compile_files(files, config.optimize, config.invalidation_mode)
+    return modules
+
+
+def import_time(path: Path, modules: List[str]) -> Dict[str, Any]:
+    """Import ``modules`` in a new interpreter that has ``path`` in ``sys.path``"""
+    env = {**os.environ, "PYTHONPATH": str(path), "PYTHONDONTWRITEBYTECODE": "1"}
+    imports = "\n".join(f"import {m}" for m in modules)
+    cmd = [sys.executable, "-X", "importtime", "-c", SCRIPT.format(imports=imports)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True)
+    return {"wall": float(proc.stdout), "importtime": parse_importtime(proc.stderr)}
+
+
+def parse_importtime(output: str) -> Dict[str, Dict[str, int]]:
+    """``self`` and ``cumulative`` times (us) for each module in ``-X importtime``"""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = {"self": int(self_us), "cumulative": int(cumulative)}
+    return times
+
+
+def measure_imports(path: Path, modules: List[str], repeat: int = 3) -> Timing:
+    runs = [import_time(path, modules) for _ in range(repeat)]
+    walls = [r["wall"] for r in runs]
+    timing: Timing = {"runs": walls, "min": min(walls)}
+    timing["median"] = statistics.median(walls)
+    if len(modules) == 1:
+        times = [r["importtime"].get(modules[0], {}) for r in runs]
+        for key in ("self", "cumulative"):
+            timing[f"{key}_us"] = statistics.median([t.get(key, 0) for t in times])
+    return timing
+
+
+def run(root: Path, repeat: int = 3) -> Dict[str, Timing]:
+    config = CoconutConfig.from_file(root / "pyproject.toml")
+    assert config is not None
+    site = root / "site-packages"
+    modules = install(root, config, site)
+    results = {"import_all": measure_imports(site, modules, repeat)}
+    for module in modules:
+        results[f"import:{module}"] = measure_imports(site, [module], repeat)
+    return results
+
+
+def parser() -> argparse.ArgumentParser:
+    cli = argparse.ArgumentParser(prog="python -m benchmarks.imports")
+    project = cli.add_argument_group("project")
+    for field, default in ProjectSpec._field_defaults.items():
+        flag = "--" + field.replace("_", "-")
+        project.add_argument(flag, type=int, default=default, metavar="N")
+    options = cli.add_argument_group("[tool.coconut] options")
+    options.add_argument("--target", default="3.6")
+    options.add_argument("--no-tco", dest="tco", action="store_false")
+    options.add_argument("--no-wrap", dest="wrap", action="store_false")
+    options.add_argument("--no-strict", dest="strict", action="store_false")
+    options.add_argument("--shared-runtime", action="store_true")
+    options.add_argument("--bytecode", action="store_true")
+    options.add_argument("--engine", default="subprocess")
+    cli.add_argument("--repeat", type=int, default=3)
+    cli.add_argument("--dir", type=Path, help="keep the generated project here")
+    cli.add_argument("--output", type=Path, help="save results in a JSON file")
+    cli.add_argument("--compare", type=Path, help="results of a previous run")
+    return cli
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parser().parse_args(argv)
+    spec = ProjectSpec(*(getattr(args, f) for f in ProjectSpec._fields))
+    names = ("target", "tco", "wrap", "strict", "shared_runtime", "bytecode")
+    options: Dict[str, Any] = {n: getattr(args, n) for n in names}
+    # The engine does not influence the generated code
+    build_options = {**options, "engine": args.engine}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = generate(args.dir or Path(tmp, "project"), spec, build_options)
+        results = run(root, args.repeat)
+
+    params = {"spec": spec._asdict(), "options": options, "repeat": args.repeat}
+    contents = report("imports", params, results)
+    print(table(contents, args.compare and load(args.compare)))
+    if args.output:
+        save(args.output, contents)
+
+
+if __name__ == "__main__":
+    main()
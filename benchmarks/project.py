@@ -0,0 +1,109 @@
+"""Generator of synthetic ``coconut`` projects, used for benchmarking."""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+
+class ProjectSpec(NamedTuple):
+    modules: int = 50
+    """Number of ``.coco`` modules (per ``src`` root), besides ``__init__`` files"""
+
+    functions: int = 10
+    """Number of function/data type groups per module (controls the file size)"""
+
+    depth: int = 2
+    """Nesting depth of the generated packages"""
+
+    data_files: int = 50
+    """Number of non-compiled files (per ``src`` root)"""
+
+    data_size: int = 1024
+    """Size of each data file (in bytes)"""
+
+    roots: int = 1
+    """Number of ``src`` roots"""
+
+    def src(self) -> List[str]:
+        return [f"src{i}" if i else "src" for i in range(self.roots)]
+
+
+HEADER = '''\
+"""Generated module {i} (benchmark)."""
+from typing import Iterable
+'''
+
+GROUP = """
+
+data Point{i}_{j}(x, y):
+    def norm(self) = (self.x**2 + self.y**2)**0.5
+
+
+def scale{i}_{j}(xs: Iterable[int]) -> list =
+    xs |> map$(x -> x * {j}) |> filter$(x -> x % 2 == 0) |> list
+
+
+def area{i}_{j}(shape):
+    case shape:
+        match Point{i}_{j}(x, y):
+            return x * y
+        match (w, h):
+            return w * h
+    return 0
+"""
+
+
+def package_dirs(root: Path, spec: ProjectSpec) -> List[Path]:
+    """Packages (one per nesting level) inside of each ``src`` root"""
+    dirs = []
+    for src in spec.src():
+        parent = root / src / "pkg"
+        for level in range(max(spec.depth, 1)):
+            dirs.append(parent)
+            parent = parent / f"sub{level}"
+    return dirs
+
+
+def _spread(items: int, buckets: List[Path]) -> Iterator[Path]:
+    for i in range(items):
+        yield buckets[i % len(buckets)]
+
+
+def pyproject(spec: ProjectSpec, options: Optional[Dict[str, Any]] = None) -> str:
+    """Contents of ``pyproject.toml``, with extra ``options`` for ``[tool.coconut]``
+    (only values that have the same representation in JSON and TOML are supported).
+    """
+    table = {"src": spec.src(), "dest": "build", **(options or {})}
+    lines = (f"{k} = {json.dumps(v)}" for k, v in table.items())
+    return "\n".join(["[tool.coconut]", *lines, ""])
+
+
+def generate(
+    root: Path, spec: ProjectSpec, options: Optional[Dict[str, Any]] = None
+) -> Path:
+    """Create a project inside of ``root`` according to ``spec``"""
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "pyproject.toml").write_text(pyproject(spec, options))
+
+    dirs = package_dirs(root, spec)
+    for directory in dirs:
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "__init__.coco").write_text('"""Generated package."""\n')
+
+    by_root = len(dirs) // spec.roots
+    for r in range(spec.roots):
+        root_dirs = dirs[r * by_root : (r + 1) * by_root]
+        for i, directory in enumerate(_spread(spec.modules, root_dirs)):
+            body = "".join(GROUP.format(i=i, j=j) for j in range(spec.functions))
+            (directory / f"mod{i}.coco").write_text(HEADER.format(i=i) + body)
+        for i, directory in enumerate(_spread(spec.data_files, root_dirs)):
+            (directory / f"data{i}.bin").write_bytes(os.urandom(spec.data_size))
+
+    return root
+
+
+def touch_module(root: Path, spec: ProjectSpec, index: int = 0):
+    """Modify one of the generated modules (to simulate an incremental build)"""
+    module = next((root / spec.src()[0]).glob(f"**/mod{index}.coco"))
+    contents = module.read_text()
+    module.write_text(contents + f"\n\nCHANGED_{len(contents)} = True\n")
@@ -0,0 +1,78 @@
+"""Timing helpers and a JSON format for results that can be compared across runs."""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+SCHEMA = 1
+
+Timing = Dict[str, Any]
+
+
+def measure(
+    fn: Callable[[], object], repeat: int = 3, setup: Optional[Callable] = None
+) -> Timing:
+    """Time ``repeat`` calls to ``fn`` (``setup`` runs before each one, untimed)"""
+    runs: List[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {"runs": runs, "min": min(runs), "median": statistics.median(runs)}
+
+
+def environment() -> Dict[str, Any]:
+    from setuptools_coconut import __version__
+    from setuptools_coconut.manifest import coconut_version
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "coconut": coconut_version(),
+        "setuptools_coconut": __version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def report(benchmark: str, params: Dict[str, Any], results: Dict[str, Timing]) -> dict:
+    return {
+        "schema": SCHEMA,
+        "benchmark": benchmark,
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+
+
+def save(file: Path, contents: dict):
+    file.write_text(json.dumps(contents, indent=2, sort_keys=True) + "\n")
+
+
+def load(file: Path) -> dict:
+    contents = json.loads(file.read_text())
+    if contents.get("schema") != SCHEMA:
+        raise ValueError(f"{file}: unsupported schema {contents.get('schema')!r}")
+    return contents
+
+
+def table(current: dict, baseline: Optional[dict] = None) -> str:
+    """Human-readable summary (median times), optionally compared to a baseline"""
+    base = (baseline or {}).get("results", {})
+    lines = [f"{'benchmark':<24} {'median (s)':>12} {'baseline':>12} {'ratio':>8}"]
+    for name, timing in current["results"].items():
+        line = f"{name:<24} {timing['median']:>12.4f}"
+        if name in base:
+            ratio = timing["median"] / base[name]["median"]
+            line += f" {base[name]['median']:>12.4f} {ratio:>7.2f}x"
+        lines.append(line)
+    if baseline and baseline.get("params") != current.get("params"):
+        print("WARNING: baseline was generated with different params", file=sys.stderr)
+    return "\n".join(lines)
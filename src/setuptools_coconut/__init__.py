@@ -1,16 +1,34 @@
 import sys
 
-if sys.version_info[:2] >= (3, 8):
-    # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
-    from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
+# Change here if project is renamed and does not equal the package name
+dist_name = "setuptools-coconut"
+
+
+def _version() -> str:
+    if sys.version_info[:2] >= (3, 8):
+        # TODO: Import directly (no conditional) when `python_requires = >= 3.8`
+        from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
+    else:
+        from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
+
+    try:
+        return version(dist_name)
+    except PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
+if sys.version_info[:2] < (3, 7):  # pragma: no cover
+    # Module level ``__getattr__`` (PEP 562) is not available
+    __version__ = _version()
 else:
-    from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
-
-try:
-    # Change here if project is renamed and does not equal the package name
-    dist_name = "setuptools-coconut"
-    __version__ = version(dist_name)
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "unknown"
-finally:
-    del version, PackageNotFoundError
+
+    def __getattr__(name: str):
+        # `importlib.metadata` is only imported when needed (it is relatively
+        # expensive and this package is imported by ``setuptools`` for every project
+        # it builds)
+        if name != "__version__":
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+        __version__ = _version()
+        globals()["__version__"] = __version__
+        return __version__
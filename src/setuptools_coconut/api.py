@@ -1,50 +1,249 @@
+import json
 import os
-import sys
+import re
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
 from functools import lru_cache
-from glob import glob
-from os.path import abspath, dirname, exists, islink, join, relpath
-from shutil import copy2
-from subprocess import STDOUT, CalledProcessError, check_output
-from typing import Iterable, List, Optional
+from os.path import abspath, dirname, isdir, isfile, join, lexists, relpath
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from . import debug
-from .config import DEFAULT_CONFIG_FILE, CoconutConfig, ValidationError
+from . import bytecode, debug, runtime, scheduler, typecheck
+from .cache import MB, CompileCache, package_level
+from .config import (
+    DEFAULT_CONFIG_FILE,
+    DEFAULT_EXCLUDE,
+    LAZY_ENV_VAR,
+    SKIP_TYPECHECK_ENV_VAR,
+    CoconutConfig,
+    ValidationError,
+    user_cache_dir,
+)
+from .engine import ENGINES, EXECUTABLE, run_cmd  # noqa: F401 (backward compat.)
+from .finder import PROJECT_MARKERS, discover_root  # noqa: F401 (backward compat.)
+from .lock import build_lock
+from .manifest import (
+    COCONUT_EXTENSIONS,
+    HEADER_FILE,
+    Manifest,
+    coconut_files,
+    forced,
+    manifest_file,
+    signature,
+)
+from .staging import STRATEGIES, in_sync
 
-EXECUTABLE = (sys.executable, "-m", "coconut")
-PROJECT_MARKERS = ("pyproject.toml", "setup.cfg", ".git", ".hg")
-COCONUT_EXTENSIONS = (".coco", ".coconut", ".coc")
+Pair = Tuple[str, str]
+Options = Tuple[str, ...]
 
 
-def discover_root(starting_point: Optional[str] = None) -> str:
-    """Find the project root based in the existence of one of the files in
-    :obj:`PROJECT_MARKERS`.
+def compile(project_root: str, config: CoconutConfig) -> List[str]:
+    """Compile the available ``.coco`` files according to ``config``
+    and returns a list of locations where the compiled Python files were
+    created.
     """
-    current = abspath(starting_point or os.getcwd())
-    parent = None
+    manifests = compile_manifests(project_root, config)
+    return [abspath(m.dest_root).rstrip(os.sep) for m in manifests]
 
-    while current != parent:
-        # current == parent => root directory
-        if any(exists(join(current, m)) for m in PROJECT_MARKERS):
-            return current
 
-        parent = dirname(current)
-
-    return current
+def compile_manifests(
+    project_root: str,
+    config: CoconutConfig,
+    sources: Optional[Mapping[str, Iterable[str]]] = None,
+) -> List[Manifest]:
+    """Compile the available ``.coco`` files according to ``config``
+    and returns the updated manifests (which list all the generated files).
+    When the ``.coco`` files inside of each ``src`` folder are already known, they
+    can be given via ``sources`` (to avoid walking the directory trees).
 
+    Only files that changed since the last compilation (according to the
+    :class:`~setuptools_coconut.manifest.Manifest` kept for each ``src`` folder)
+    are given to the compiler. When ``config.cache`` is enabled, those are first
+    looked up in the user-level :class:`~setuptools_coconut.cache.CompileCache`.
 
-@lru_cache()
-def compile(project_root: str, config: CoconutConfig) -> Iterable[str]:
-    """Compile the available ``.coco`` files according to ``config``
-    and returns a list of locations where the compiled Python files were
-    created.
+    Concurrent builds sharing the same ``dest`` are coordinated via
+    :func:`~setuptools_coconut.lock.build_lock`: the first process compiles, while
+    the others wait and then find the manifests up to date.
     """
+    with build_lock(join(project_root, config.state_dir())):
+        manifests = _compile_manifests(project_root, config, sources)
+
+    if (
+        config.mypy
+        and config.mypy_mode != "coconut"
+        and not _flag(SKIP_TYPECHECK_ENV_VAR)
+    ):
+        # All files are checked in every build (``mypy`` itself is incremental)
+        check = typecheck.start if config.mypy_background else typecheck.run
+        check(project_root, config, [f for m in manifests for f in m.outputs()])
+
+    return manifests
+
+
+def _compile_manifests(
+    project_root: str,
+    config: CoconutConfig,
+    sources: Optional[Mapping[str, Iterable[str]]],
+) -> List[Manifest]:
     opts = config.as_cli_args()
+    sig = signature(opts)
+    if config.overrides:
+        sig["overrides"] = [json.loads(o.json()) for o in config.overrides]
+    if config.shared_runtime:
+        sig["shared_runtime"] = True
+    coconut = ENGINES[config.engine]
+    state_dir = join(project_root, config.state_dir())
+    cache = compile_cache(config, opts)
+    scheduled = config.scheduler and "--mypy" not in opts
+    default = tuple(opts)
+    manifests: List[Manifest] = []
+    jobs: List[Tuple[Options, List[Pair]]] = []
+    compiled: List[Tuple[Options, List[Pair]]] = []
+    overridden: List[Pair] = []
+    outdated: List[Pair] = []
     for src, dest in config.build_paths().items():
         dest_root = join(project_root, dest)
         src_root = join(project_root, src)
-        debug.print("coconut", src, dest, *opts)
-        run_cmd([*EXECUTABLE, src_root, dest_root, *opts])
-        yield abspath(dest_root).rstrip(os.pathsep)
+        with debug.span("check_stale", src=src) as attrs:
+            file = manifest_file(state_dir, src)
+            manifest = Manifest.load(file, src_root, dest_root, sig)
+            files = list(sources[src] if sources else coconut_files(src_root))
+            stale = manifest.stale(files)
+            outdated.extend(stale)
+            groups = group_by_options(project_root, config, stale)
+            for job_opts, pairs in groups.items():
+                if job_opts != default:
+                    overridden.extend(pairs)
+                if cache:
+                    job_sig = signature(list(job_opts))
+                    pairs[:] = [p for p in pairs if not cache.restore(job_sig, *p)]
+            stale = [pair for pairs in groups.values() for pair in pairs]
+            attrs.update(files=len(files), stale=len(stale))
+        whole = stale and len(stale) == len(files) and [*groups] == [default]
+        if whole and not scheduled:
+            jobs.append((default, [(src_root, dest_root)]))
+        else:
+            jobs.extend((o, pairs) for o, pairs in groups.items() if pairs)
+            if not stale:
+                debug.print(f"Up to date: {src} => {dest}")
+        compiled.extend(groups.items())
+        manifests.append(manifest)
+
+    if config.batch:
+        # Pairs with the same options are compiled at once (sharing the same pool)
+        batches: Dict[Options, List[Pair]] = {}
+        for job_opts, pairs in jobs:
+            batches.setdefault(job_opts, []).extend(pairs)
+        jobs = list(batches.items())
+
+    for job_opts, pairs in jobs:
+        paths = [relpath(p, project_root) for p, _ in pairs]
+        debug.print("coconut", *paths, *job_opts)
+        if scheduled:
+            with debug.span("scheduler", files=len(pairs)):
+                scheduler.compile_files(pairs, job_opts, config.workers())
+            continue
+        with debug.span("coconut", paths=paths, engine=config.engine):
+            coconut([*file_pairs(pairs), *package_mode(job_opts), *job_opts])
+
+    if overridden:
+        restore_headers(config, overridden)
+
+    if cache:
+        for job_opts, pairs in compiled:
+            for file, output in pairs:
+                cache.store(signature(list(job_opts)), file, output)
+        cache.evict()
+
+    if config.shared_runtime:
+        # After storing in the cache, which keeps the output of ``coconut`` as is
+        runtime.share(outdated)
+
+    for manifest in manifests:
+        manifest.commit()
+        manifest.save()
+
+    return manifests
+
+
+def group_by_options(
+    project_root: str, config: CoconutConfig, pairs: Iterable[Pair]
+) -> Dict[Options, List[Pair]]:
+    """Group ``(source, output)`` pairs by the compiler options that apply to each
+    source (see :attr:`~setuptools_coconut.config.CoconutConfig.overrides`).
+    """
+    groups: Dict[Options, List[Pair]] = {}
+    default = tuple(config.as_cli_args())
+    for source, output in pairs:
+        if config.overrides:
+            rel = relpath(source, project_root)
+            opts = tuple(config.for_file(rel).as_cli_args())
+        else:
+            opts = default
+        groups.setdefault(opts, []).append((source, output))
+    return groups
+
+
+def restore_headers(config: CoconutConfig, pairs: Iterable[Pair]):
+    """The ``__coconut__.py`` header depends on the compiler options, so the ones
+    written for files compiled with :attr:`~.CoconutConfig.overrides` are replaced
+    by the header corresponding to the project-wide options (the same way
+    :class:`~setuptools_coconut.cache.CompileCache` finds the header).
+    """
+    from coconut.compiler import Compiler
+
+    files = {
+        join(dirname(output), HEADER_FILE)
+        for source, output in pairs
+        if package_level(source) == 0
+    }
+    compiler = Compiler()
+    compiler.setup(**config.compiler_options())
+    header = compiler.getheader("__coconut__")
+    for file in files:
+        if not isfile(file):
+            continue
+        with open(file, "r", encoding="utf-8") as f:
+            if f.read() == header:
+                continue
+        with open(file, "w", encoding="utf-8") as f:
+            f.write(header)
+        debug.print(f"Replaced header: {file!r}")
+
+
+def compile_cache(config: CoconutConfig, opts: List[str]) -> Optional[CompileCache]:
+    """Type checking depends on the entire project, so cached files cannot be
+    reused when ``coconut`` runs ``mypy``.
+    """
+    if not config.cache or "--mypy" in opts or forced(opts):
+        return None
+    return CompileCache(join(user_cache_dir(), "compiled"), config.cache_size * MB)
+
+
+def file_pairs(pairs: Iterable[Tuple[str, str]]) -> List[str]:
+    """Command line arguments for compiling several ``(source, dest)`` pairs at once"""
+    args: List[str] = []
+    for src, dest in pairs:
+        args.extend((src, dest) if not args else ("--and", src, dest))
+    return args
+
+
+def package_mode(opts: Sequence[str]) -> List[str]:
+    """Individual files have to be explicitly compiled in "package mode", so the
+    output is the same as when the entire directory is given to ``coconut``
+    (for directories this is already the default).
+    """
+    return [] if "--mypy" in opts else ["--package"]
 
 
 def compiled_files(path: str = "") -> Iterable[str]:
@@ -58,98 +257,244 @@ def compiled_files(path: str = "") -> Iterable[str]:
     For more information, see `setuptools user guide on extensions
     <https://setuptools.pypa.io/en/latest/userguide/extension.html#adding-support-for-revision-control-systems>`_.
     """  # noqa
+    current = current_session()
+    if current is None:
+        debug.print("Skipping ...")
+        return
+
+    path = path or "."
+    debug.print(f"Directory from setuptools integration: {abspath(path)}")
+    for file in current.files_under(path):
+        yield debug.inspect(relpath(file, path))
+
+
+class Session:
+    """Files produced when building a project.
+
+    ``setuptools`` calls :func:`compiled_files` several times during the same build
+    (e.g. once per package directory), so the compilation and the linking/copying of
+    the other files are done only once, and the results are kept in a sorted
+    index, which allows efficiently retrieving the files inside a given directory.
+
+    When ``lazy`` is ``True``, only the other files are linked/copied (the ``.coco``
+    files are compiled when imported, see :mod:`~setuptools_coconut.editable`).
+    """
+
+    def __init__(self, project_root: str, config: CoconutConfig, lazy: bool = False):
+        self.root = project_root
+        self.config = config
+        self.lazy = lazy
+        self._index: Optional[List[str]] = None
+        self._generated: Set[str] = set()
+
+    @property
+    def index(self) -> List[str]:
+        if self._index is None:
+            self._index = sorted({_norm(f) for f in self._build()})
+        return self._index
+
+    @property
+    def built(self) -> bool:
+        """Whether the files were already produced (see :attr:`index`)"""
+        return self._index is not None
+
+    @property
+    def generated(self) -> Set[str]:
+        """Files produced by the compiler (and ``bytecode``), as in :attr:`index`"""
+        self.index  # Triggers the build (if necessary)
+        return self._generated
+
+    def _build(self) -> Iterator[str]:
+        manifests = [] if self.lazy else compile_manifests(self.root, self.config)
+        for manifest in manifests:
+            with debug.span("outputs", dest=manifest.dest_root):
+                outputs = manifest.outputs()
+            if self.config.bytecode:
+                outputs += bytecode.compile_files(
+                    outputs,
+                    self.config.optimize,
+                    self.config.invalidation_mode,
+                    self.config.workers(),
+                )
+            self._generated.update(_norm(f) for f in outputs)
+            yield from outputs
+
+        # We need to move non-compiled files to the build dir also
+        # so users can use "package_data"
+        for src, dest in self.config.build_paths().items():
+            if src == dest:
+                continue
+            other_files = OtherFiles(
+                self.root, src, exclude=self.config.exclude, staging=self.config.staging
+            )
+            state_dir = join(self.root, self.config.state_dir())
+            with build_lock(state_dir), debug.span("other_files", src=src):
+                staged = list(other_files.link_or_copy(join(self.root, dest)))
+            yield from staged
+
+    def files_under(self, path: str) -> Iterator[str]:
+        """Absolute paths for the files inside of ``path``"""
+        prefix = _norm(path).rstrip("/") + "/"
+        start = bisect_left(self.index, prefix)
+        # "/" is followed by "0" in the ASCII table
+        end = bisect_left(self.index, prefix[:-1] + "0", lo=start)
+        return iter(self.index[start:end])
+
+
+@lru_cache()
+def session(project_root: str, config: CoconutConfig, lazy: bool = False) -> Session:
+    """Session shared by all the calls to :func:`compiled_files` during a build.
+    The cache is cleared when ``setuptools`` starts a new build
+    (see :func:`~setuptools_coconut.finder.start_build`).
+    """
+    return Session(project_root, config, lazy)
+
+
+def current_session() -> Optional[Session]:
+    """:func:`session` for the project being built (``None`` when the project has no
+    configuration), the same for all the hooks of the build.
+    """
     root = discover_root()
     debug.print(f"Detected root directory: {root}")
     config = CoconutConfig.from_file(join(root, DEFAULT_CONFIG_FILE))
     if config is None:
-        debug.print("Skipping ...")
-        return
+        return None
+    return session(root, config, _flag(LAZY_ENV_VAR))
 
-    path = path or "."
-    abs_path = abspath(path).rstrip(os.pathsep).replace(os.pathsep, "/")
-    debug.print(f"Directory from setuptools integration: {abs_path}")
-    for compiled_path in compile(root, config):
-        if compiled_path.replace(os.pathsep, "/").startswith(abs_path):
-            for file in glob(join(compiled_path, "**", "*.py")):
-                yield debug.inspect(relpath(file, path))
-        else:
-            compiled_relpath = relpath(compiled_path, path)
-            debug.print(f"{compiled_relpath!r} should be inside {abs_path!r}")
 
-    # We need to move non-compiled files to the build dir also
-    # so users can use "package_data"
-    for src, dest in config.build_paths().items():
-        if src == dest:
-            continue
-        other_files = OtherFiles(root, src)
-        for file in other_files.link_or_copy(dest):
-            if file.replace(os.pathsep, "/").startswith(abs_path):
-                yield debug.inspect(relpath(file, path))
+def active_session() -> Optional[Session]:
+    """Similar to :func:`current_session`, but ``None`` is also returned when the
+    files of the current build were not produced yet (e.g. by :func:`compiled_files`),
+    so that the build is never triggered.
+    """
+    if not session.cache_info().currsize:
+        return None
+    current = current_session()
+    return current if current is not None and current.built else None
+
+
+def _flag(env_var: str) -> bool:
+    return os.getenv(env_var) not in (None, "", "0", "false")
+
+
+def _norm(path: str) -> str:
+    return abspath(path).replace(os.sep, "/")
 
 
 class OtherFiles:
+    """Non-compiled files inside of ``parent_dir`` (e.g. ``package_data``).
+
+    Directories matching one of the ``exclude`` patterns are pruned while walking
+    the tree, and files that are already linked/copied into the destination
+    are left untouched. The remaining ones are staged in parallel, according to the
+    ``staging`` strategy (see :mod:`~setuptools_coconut.staging`).
+    """
+
     def __init__(
-        self, project_root: str, parent_dir: str, coconut_extensions=COCONUT_EXTENSIONS
+        self,
+        project_root: str,
+        parent_dir: str,
+        coconut_extensions=COCONUT_EXTENSIONS,
+        exclude: Sequence[str] = DEFAULT_EXCLUDE,
+        staging: str = "auto",
     ):
         self._root = project_root
         self._parent = join(project_root, parent_dir)
         self._files: Optional[List[str]] = None
         self._ext = coconut_extensions
-        self._os_supports_symlink: Optional[bool] = None
-        self._coconut_extensions = coconut_extensions
+        self._coconut_extensions = tuple(coconut_extensions)
+        self._exclude = re.compile("|".join(map(translate, exclude)) or "(?!)")
+        start = list(STRATEGIES).index("symlink" if staging == "auto" else staging)
+        self._staging = list(STRATEGIES)[start:]
+        self._unsupported: Set[str] = set()
 
     @property
     def files(self) -> List[str]:
         if self._files is None:
-            res: List[str] = []
-            for directory, _, files in os.walk(self._parent):
-                res.extend(
-                    join(directory, f)
-                    for f in files
-                    if not any(f.endswith(e) for e in self._coconut_extensions)
-                )
-            self._files = res
+            self._files = list(self._scan(self._parent, ""))
         return self._files
 
+    def _scan(self, directory: str, prefix: str) -> Iterator[str]:
+        with os.scandir(directory) as it:
+            entries = list(it)
+        for entry in entries:
+            rel = prefix + entry.name
+            if self._exclude.match(entry.name) or self._exclude.match(rel):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._scan(entry.path, rel + "/")
+            elif entry.is_symlink() and entry.is_dir():
+                continue  # Similarly to `os.walk`, symlinks to dirs are not followed
+            elif not entry.name.endswith(self._coconut_extensions):
+                yield entry.path
+
     def _link_or_copy_file(self, orig: str, dest: str):
         root = self._root
+        with debug.span("stage", file=orig) as attrs:
+            if in_sync(orig, dest):
+                attrs["action"] = "skip"
+                return dest
+            if lexists(dest):
+                os.unlink(dest)
 
-        os.makedirs(dirname(dest), exist_ok=True)
-        if self._os_supports_symlink is False:  # pragma: no cover
-            action = "COPY"
-            copy2(orig, dest)
-        else:
-            action = "LINK"
-            try:
-                if islink(dest):
-                    os.unlink(dest)
-                os.symlink(orig, dest)
-                self._os_supports_symlink = True
-            except OSError:  # pragma: no cover
-                self._os_supports_symlink = False
-                action = "COPY"
-                copy2(orig, dest)
-
-        debug.lazy(lambda: f"{action}: {relpath(orig, root)} => {relpath(dest, root)}")
+            for action in self._strategies:
+                try:
+                    STRATEGIES[action](orig, dest)
+                    break
+                except OSError:  # pragma: no cover
+                    if action == "copy":
+                        raise
+                    self._unsupported.add(action)
+            attrs["action"] = action
+
+        debug.lazy(
+            lambda: f"{action.upper()}: {relpath(orig, root)} => {relpath(dest, root)}"
+        )
         return dest
 
+    @property
+    def _strategies(self) -> List[str]:
+        return [s for s in self._staging if s not in self._unsupported]
+
     def link_or_copy(self, other_dir: str) -> Iterable[str]:
         new_path = abspath(other_dir)
-        for f in self.files:
-            dest = join(new_path, relpath(f, self._parent))
-            yield self._link_or_copy_file(f, dest)
+        pairs = [(f, join(new_path, relpath(f, self._parent))) for f in self.files]
+        yield from self._stage(pairs)
 
+    def sync(self, other_dir: str, files: Iterable[str]) -> List[str]:
+        """Similar to :meth:`link_or_copy`, but only for the given ``files``
+        (e.g. files modified after the last build).
+        Files that no longer exist are removed from ``other_dir``.
+        """
+        new_path = abspath(other_dir)
+        pairs = []
+        for file in files:
+            if self.excluded(file):
+                continue
+            dest = join(new_path, relpath(file, self._parent))
+            if isfile(file):
+                pairs.append((file, dest))
+            elif lexists(dest) and not isdir(dest):
+                os.unlink(dest)
+                debug.print(f"REMOVE: {relpath(dest, self._root)}")
+        return list(self._stage(pairs))
 
-def run_cmd(cmd):
-    try:
-        return check_output(
-            cmd,
-            stderr=STDOUT,
-            universal_newlines=True,
+    def excluded(self, file: str) -> bool:
+        """``True`` for files that are not handled by this class"""
+        rel = relpath(file, self._parent).replace(os.sep, "/")
+        if rel.startswith("../") or file.endswith(self._coconut_extensions):
+            return True
+        parts = rel.split("/")
+        return any(
+            self._exclude.match(name) or self._exclude.match("/".join(parts[: i + 1]))
+            for i, name in enumerate(parts)
         )
-    except CalledProcessError as ex:  # pragma: no cover
-        print(debug.format("Error for command", " ".join(cmd), "\n", ex.output))
-        raise
+
+    def _stage(self, pairs: List[Tuple[str, str]]) -> Iterator[str]:
+        for parent in {dirname(dest) for _, dest in pairs}:
+            os.makedirs(parent, exist_ok=True)
+        with ThreadPoolExecutor() as executor:
+            yield from executor.map(lambda p: self._link_or_copy_file(*p), pairs)
 
 
 __all__ = [
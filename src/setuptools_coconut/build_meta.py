@@ -0,0 +1,212 @@
+"""Build backend (:pep:`517`) that extends :mod:`setuptools.build_meta`.
+
+All the hooks are provided by ``setuptools``, with the exception of:
+
+- the ones for editable installs (:pep:`660`), which install the project in "lazy"
+  mode: ``.coco`` files are only compiled when they are imported for the first time
+  (see :mod:`setuptools_coconut.editable`);
+- the ones that build wheels: the type check (when ``mypy`` is enabled) only runs
+  in :func:`build_wheel`, which waits for checks running in the background
+  (``mypy_background``) and fails if errors are found. With ``stream_wheel``,
+  :func:`build_wheel` asks ``bdist_wheel`` to add the generated files directly to
+  the archive (see :mod:`setuptools_coconut.stream`).
+
+To use it, change the ``[build-system]`` table in your ``pyproject.toml``:
+
+.. code-block:: toml
+
+   [build-system]
+   requires = ["setuptools>=64", "setuptools-coconut"]
+   build-backend = "setuptools_coconut.build_meta"
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+import zipfile
+from contextlib import contextmanager
+from os.path import abspath, join
+from subprocess import CalledProcessError
+from typing import Iterator, Mapping, Optional, Union
+
+from setuptools import build_meta as _orig
+from setuptools.build_meta import *  # noqa: F401,F403
+
+from . import debug, stream, typecheck
+from .config import (
+    DEFAULT_CONFIG_FILE,
+    LAZY_ENV_VAR,
+    SKIP_TYPECHECK_ENV_VAR,
+    CoconutConfig,
+)
+from .finder import discover_root
+
+MODULE_PREFIX = "_setuptools_coconut_editable_"
+EDITABLE_STATE = "editable.json"
+
+
+def get_requires_for_build_wheel(config_settings: Optional[dict] = None):
+    with _env(SKIP_TYPECHECK_ENV_VAR, "1"):
+        return _orig.get_requires_for_build_wheel(config_settings)
+
+
+def prepare_metadata_for_build_wheel(
+    metadata_directory: str, config_settings: Optional[dict] = None
+) -> str:
+    with _env(SKIP_TYPECHECK_ENV_VAR, "1"):
+        return _orig.prepare_metadata_for_build_wheel(
+            metadata_directory, config_settings
+        )
+
+
+def build_wheel(
+    wheel_directory: str,
+    config_settings: Optional[dict] = None,
+    metadata_directory: Optional[str] = None,
+) -> str:
+    config = CoconutConfig.from_file(join(discover_root(), DEFAULT_CONFIG_FILE))
+    streaming = config is not None and config.stream_wheel
+    stream.streamed.clear()
+    with _env(stream.STREAM_ENV_VAR, "1" if streaming else ""):
+        name = _orig.build_wheel(wheel_directory, config_settings, metadata_directory)
+    wheel = join(wheel_directory, name)
+    try:
+        typecheck.collect()  # Started in the background (``mypy_background``)
+    except CalledProcessError:
+        os.remove(wheel)
+        raise
+    if stream.streamed:
+        # Not written by ``bdist_wheel`` (e.g. customised by the project)
+        with debug.span("stream_wheel", files=len(stream.streamed)):
+            add_files(wheel, {n: _read(f) for n, f in stream.streamed.items()})
+        debug.print(f"{len(stream.streamed)} generated files streamed into {wheel!r}")
+    return name
+
+
+def get_requires_for_build_sdist(config_settings: Optional[dict] = None):
+    with _env(SKIP_TYPECHECK_ENV_VAR, "1"):
+        return _orig.get_requires_for_build_sdist(config_settings)
+
+
+def build_sdist(sdist_directory: str, config_settings: Optional[dict] = None) -> str:
+    with _env(SKIP_TYPECHECK_ENV_VAR, "1"):
+        return _orig.build_sdist(sdist_directory, config_settings)
+
+
+def get_requires_for_build_editable(config_settings: Optional[dict] = None):
+    with _env(LAZY_ENV_VAR, "1"):
+        return _orig.get_requires_for_build_editable(config_settings)
+
+
+def prepare_metadata_for_build_editable(
+    metadata_directory: str, config_settings: Optional[dict] = None
+) -> str:
+    with _env(LAZY_ENV_VAR, "1"):
+        return _orig.prepare_metadata_for_build_editable(
+            metadata_directory, config_settings
+        )
+
+
+def build_editable(
+    wheel_directory: str,
+    config_settings: Optional[dict] = None,
+    metadata_directory: Optional[str] = None,
+) -> str:
+    with _env(LAZY_ENV_VAR, "1"):
+        name = _orig.build_editable(
+            wheel_directory, config_settings, metadata_directory
+        )
+    root = discover_root()
+    config = CoconutConfig.from_file(join(root, DEFAULT_CONFIG_FILE))
+    if config is not None:
+        add_finder(join(wheel_directory, name), root, config)
+    return name
+
+
+def finder_config(project_root: str, config: CoconutConfig) -> dict:
+    paths = {
+        abspath(join(project_root, src)): abspath(join(project_root, dest))
+        for src, dest in config.build_paths().items()
+    }
+    root = abspath(project_root).replace(os.sep, "/")
+    overrides = [
+        ([f"{root}/{p}" for p in o.paths], o.compiler_options())
+        for o in config.overrides
+    ]
+    return {
+        "paths": paths,
+        "options": config.compiler_options(),
+        "overrides": overrides,
+        "state": abspath(join(project_root, config.state_dir(), EDITABLE_STATE)),
+    }
+
+
+def add_finder(wheel: str, project_root: str, config: CoconutConfig):
+    """Add a ``.pth`` file that installs
+    :class:`~setuptools_coconut.editable.CoconutFinder` to an existing ``wheel``.
+    """
+    dist = os.path.basename(wheel).split("-")[0]
+    module = MODULE_PREFIX + re.sub(r"\W", "_", dist).lower()
+    with open(join(os.path.dirname(__file__), "editable.py"), encoding="utf-8") as f:
+        code = f.read()
+    code += f"\n\nCONFIG = {json.dumps(finder_config(project_root, config))!r}\n"
+    code += "install(__import__('json').loads(CONFIG))\n"
+    files = {f"{module}.py": code, f"{module}.pth": f"import {module}\n"}
+    add_files(wheel, files)
+    debug.print(f"Lazy compilation enabled in {wheel!r}")
+
+
+def add_files(wheel: str, files: Mapping[str, Union[str, bytes]]):
+    """Add ``files`` (names and contents) to the root of ``wheel``,
+    updating its ``RECORD`` (existing entries with the same names are replaced).
+    """
+    tmp = f"{wheel}.tmp"
+    with zipfile.ZipFile(wheel) as orig, zipfile.ZipFile(
+        tmp, "w", zipfile.ZIP_DEFLATED
+    ) as new:
+        record_name = next(
+            n for n in orig.namelist() if n.endswith(".dist-info/RECORD")
+        )
+        record = orig.read(record_name).decode("utf-8").splitlines()
+        for item in orig.infolist():
+            if item.filename != record_name and item.filename not in files:
+                new.writestr(item, orig.read(item))
+        record = [r for r in record if r.rsplit(",", 2)[0] not in files]
+        for name, contents in files.items():
+            data = contents.encode("utf-8") if isinstance(contents, str) else contents
+            new.writestr(_zip_info(name), data)
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+            record.insert(
+                -1, f"{name},sha256={digest.rstrip(b'=').decode()},{len(data)}"
+            )
+        new.writestr(record_name, "\n".join(record) + "\n")
+    os.replace(tmp, wheel)
+
+
+def _zip_info(name: str) -> zipfile.ZipInfo:
+    # Same as ``wheel`` (reproducible builds)
+    timestamp = int(os.getenv("SOURCE_DATE_EPOCH", time.time()))
+    info = zipfile.ZipInfo(name, time.gmtime(timestamp)[:6])
+    info.external_attr = 0o644 << 16  # Default permissions for regular files
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def _read(file: str) -> bytes:
+    with open(file, "rb") as f:
+        return f.read()
+
+
+@contextmanager
+def _env(name: str, value: str) -> Iterator[None]:
+    orig = os.environ.get(name)
+    os.environ[name] = value
+    try:
+        yield
+    finally:
+        if orig is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = orig
@@ -0,0 +1,84 @@
+"""Byte-compilation of the generated ``.py`` files into ``__pycache__``, so they can be
+shipped inside of wheels (see the ``bytecode`` option in
+:class:`~setuptools_coconut.config.CoconutConfig`).
+
+``.pyc`` files are specific to the interpreter that generates them (e.g.
+``__pycache__/module.cpython-39.pyc``): other Python versions ignore them and
+fallback to compiling the ``.py`` file as usual.
+
+Hash-based ``.pyc`` files (and the APIs to create them) require Python 3.7, so the
+functions that depend on them are only imported when needed (this module is still
+imported in older interpreters, but the option cannot be enabled).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import MAGIC_NUMBER, cache_from_source
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from . import debug
+
+Job = Tuple[str, int, str]
+
+
+def cache_file(source: str, optimize: int = 0) -> str:
+    """Location of the ``.pyc`` file for ``source`` in the current interpreter"""
+    return cache_from_source(source, optimization=optimize or "")
+
+
+def up_to_date(source: str, pyc: str, mode: str) -> bool:
+    """Check the header of an existing ``pyc`` (:pep:`552`) against ``source``,
+    considering the given invalidation ``mode`` (e.g. ``"checked-hash"``)
+    """
+    from importlib.util import source_hash
+
+    try:
+        with open(pyc, "rb") as f:
+            header = f.read(16)
+        if header[:4] != MAGIC_NUMBER:
+            return False
+        flags = int.from_bytes(header[4:8], "little")
+        if mode == "timestamp":
+            st = os.stat(source)
+            mtime = (int(st.st_mtime) & 0xFFFFFFFF).to_bytes(4, "little")
+            size = (st.st_size & 0xFFFFFFFF).to_bytes(4, "little")
+            return flags == 0 and header[8:16] == mtime + size
+        checked = mode == "checked-hash"
+        with open(source, "rb") as f:
+            digest = source_hash(f.read())
+        return flags == (0b11 if checked else 0b01) and header[8:16] == digest
+    except OSError:
+        return False
+
+
+def _compile(job: Job) -> str:
+    import py_compile
+
+    source, optimize, mode = job
+    pyc = cache_file(source, optimize)
+    if not up_to_date(source, pyc, mode):
+        enum = py_compile.PycInvalidationMode[mode.upper().replace("-", "_")]
+        py_compile.compile(
+            source, pyc, doraise=True, optimize=optimize, invalidation_mode=enum
+        )
+    return pyc
+
+
+def compile_files(
+    files: Iterable[str],
+    optimize: Sequence[int] = (0,),
+    invalidation_mode: str = "checked-hash",
+    workers: Optional[int] = None,
+) -> List[str]:
+    """Byte-compile the ``.py`` files (once for each ``optimize`` level) and return
+    the paths of the ``.pyc`` files. Up to date ``.pyc`` files are not rewritten.
+    When ``workers`` is not 1, the files are compiled in parallel processes.
+    """
+    jobs = [
+        (f, o, invalidation_mode) for f in files if f.endswith(".py") for o in optimize
+    ]
+    with debug.span("bytecode", files=len(jobs)):
+        if workers == 1 or len(jobs) < 2:
+            return [_compile(job) for job in jobs]
+        with ProcessPoolExecutor(workers) as pool:
+            chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+            return list(pool.map(_compile, jobs, chunksize=chunksize))
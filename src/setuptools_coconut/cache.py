@@ -0,0 +1,137 @@
+"""Content-addressed cache of compiled files, shared by all the projects of the
+current user (see :func:`~setuptools_coconut.config.user_cache_dir`).
+
+Entries are identified by the hash of the source code, plus everything else that
+influences the output of the compiler (``coconut`` version and command line
+arguments) and evicted in "least recently used" order when the cache grows
+beyond its maximum size.
+"""
+import filecmp
+import hashlib
+import json
+import os
+from os.path import abspath, dirname, exists, join
+from shutil import copyfile
+from typing import Dict, Iterator, Tuple
+
+from . import debug
+from .manifest import COCONUT_EXTENSIONS, HEADER_FILE, file_hash
+
+MB = 2**20
+
+
+def package_level(file: str, extensions=COCONUT_EXTENSIONS) -> int:
+    """Mirrors how ``coconut`` determines the depth of a file inside its package
+    (which influences the generated code).
+    """
+    level = -1
+    directory = dirname(abspath(file))
+    while any(exists(join(directory, f"__init__{ext}")) for ext in extensions):
+        level += 1
+        parent = dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return max(level, 0)
+
+
+def _same_contents(file1: str, file2: str) -> bool:
+    try:
+        return filecmp.cmp(file1, file2, shallow=False)
+    except OSError:
+        return False
+
+
+class CompileCache:
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self._stored = 0
+        self._headers: Dict[str, str] = {}
+        """Headers restored by this instance (file => key)"""
+
+    def key(self, signature: Dict[str, object], *parts: object) -> str:
+        contents = json.dumps([signature, *parts], sort_keys=True)
+        return hashlib.sha256(contents.encode()).hexdigest()
+
+    def file_key(self, signature: Dict[str, object], file: str) -> str:
+        return self.key(signature, file_hash(file), package_level(file))
+
+    def header_key(self, signature: Dict[str, object]) -> str:
+        return self.key(signature, HEADER_FILE)
+
+    def _path(self, key: str) -> str:
+        return join(self.directory, key[:2], f"{key}.py")
+
+    def restore(self, signature: Dict[str, object], file: str, output: str) -> bool:
+        """Copy the compiled version of ``file`` to ``output`` (if it is cached).
+        Return ``False`` in the case of a cache miss.
+        """
+        entry = self._path(self.file_key(signature, file))
+        if not exists(entry):
+            return False
+
+        # The header depends on the options, so the existing one might be outdated
+        header = join(dirname(output), HEADER_FILE)
+        header_key = self.header_key(signature)
+        needs_header = package_level(file) == 0
+        header_entry = self._path(header_key)
+        if needs_header and not exists(header_entry):
+            return False
+
+        os.makedirs(dirname(output), exist_ok=True)
+        self._copy_from(entry, output)
+        if needs_header and self._headers.get(header) != header_key:
+            if not _same_contents(header_entry, header):
+                self._copy_from(header_entry, header)
+            self._headers[header] = header_key
+        debug.print(f"Restored from cache: {output!r}")
+        return True
+
+    def store(self, signature: Dict[str, object], file: str, output: str):
+        """Add the compiled ``output`` of ``file`` to the cache"""
+        self._copy_to(output, self.file_key(signature, file))
+        header = join(dirname(output), HEADER_FILE)
+        if package_level(file) == 0 and exists(header):
+            self._copy_to(header, self.header_key(signature))
+
+    def _copy_from(self, entry: str, dest: str):
+        copyfile(entry, dest)
+        os.utime(entry)  # Used for LRU
+
+    def _copy_to(self, file: str, key: str):
+        entry = self._path(key)
+        os.makedirs(dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        copyfile(file, tmp)
+        os.replace(tmp, entry)
+        self._stored += 1
+
+    def _entries(self) -> Iterator[Tuple[float, int, str]]:
+        for directory, _, files in os.walk(self.directory):
+            for file in files:
+                path = join(directory, file)
+                try:
+                    st = os.stat(path)
+                except OSError:  # pragma: no cover
+                    continue  # removed by a concurrent process
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits
+        into ``max_size``.
+        """
+        if not self._stored:
+            return
+        self._stored = 0
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:  # pragma: no cover
+                pass
+            total -= size
+            debug.print(f"Evicted from cache: {path!r}")
@@ -0,0 +1,110 @@
+"""Command line interface: ``python -m setuptools_coconut <command>``"""
+import argparse
+import sys
+from os.path import join
+from typing import List, Optional
+
+from . import dist_name
+from .engine import ENGINES
+
+CHECK_DIR = "check"
+
+
+def server(args: argparse.Namespace):
+    from .server import serve
+
+    serve(args.socket)
+
+
+def watch(args: argparse.Namespace):
+    from .api import discover_root
+    from .config import DEFAULT_CONFIG_FILE, CoconutConfig
+    from .watch import Watch
+
+    root = discover_root()
+    config = CoconutConfig.from_file(join(root, DEFAULT_CONFIG_FILE))
+    if config is None:
+        sys.exit(f"No [tool.coconut] table found in {root!r}")
+    if args.engine:
+        config = config.copy(update={"engine": args.engine})
+    elif config.engine == "subprocess":
+        # The compiler can stay in memory during the entire session
+        config = config.copy(update={"engine": "inprocess"})
+    Watch(root, config).run(poll=args.poll)
+
+
+def check(args: argparse.Namespace):
+    from subprocess import CalledProcessError
+
+    from . import debug, typecheck
+    from .api import OtherFiles, compile_manifests, discover_root
+    from .config import DEFAULT_CONFIG_FILE, CoconutConfig
+
+    root = discover_root()
+    config = CoconutConfig.from_file(join(root, DEFAULT_CONFIG_FILE))
+    if config is None:
+        sys.exit(f"No [tool.coconut] table found in {root!r}")
+    mode = args.mode or ("cache" if config.mypy_mode == "coconut" else config.mypy_mode)
+    update = {"mypy": True, "mypy_mode": mode, "mypy_background": False}
+    checked = config.copy(update=update)
+    try:
+        if checked.as_cli_args() == config.as_cli_args():
+            compile_manifests(root, checked)
+        else:
+            # The outputs differ from the ones of a regular build
+            # (``--line-numbers``), so they are kept apart (otherwise both would
+            # recompile all the files). The type check still uses the state dir
+            # of the project (``mypy`` cache and daemon).
+            separate = config.copy(
+                update={
+                    "dest": join(config.state_dir(), CHECK_DIR),
+                    "argv": (*config.argv, "--line-numbers"),
+                }
+            )
+            for src, dest in separate.build_paths().items():
+                other = OtherFiles(
+                    root, src, exclude=config.exclude, staging=config.staging
+                )
+                list(other.link_or_copy(join(root, dest)))  # e.g. ``.py`` modules
+            manifests = compile_manifests(root, separate)
+            outputs = [f for m in manifests for f in m.outputs()]
+            typecheck.run(root, checked, outputs)
+    except CalledProcessError as ex:
+        sys.exit(ex.returncode or 1)
+    print(debug.format("No type errors found"))
+
+
+def parser() -> argparse.ArgumentParser:
+    prog = f"python -m {__package__}"
+    main = argparse.ArgumentParser(prog=prog, description=dist_name)
+    commands = main.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    cmd = commands.add_parser("server", help="start a local compilation server")
+    cmd.add_argument("--socket", help="path for the Unix socket")
+    cmd.set_defaults(func=server)
+
+    cmd = commands.add_parser("watch", help="compile files as soon as they change")
+    cmd.add_argument(
+        "--engine",
+        choices=ENGINES,
+        help="overwrite the configuration (by default `inprocess` is used "
+        "instead of `subprocess`)",
+    )
+    cmd.add_argument("--poll", action="store_true", help="don't use inotify")
+    cmd.set_defaults(func=watch)
+
+    cmd = commands.add_parser("check", help="compile and type check with mypy")
+    cmd.add_argument(
+        "--mode",
+        choices=("cache", "daemon"),
+        help="overwrite `mypy_mode` (by default `cache` is used instead of `coconut`)",
+    )
+    cmd.set_defaults(func=check)
+
+    return main
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parser().parse_args(argv)
+    args.func(args)
@@ -1,17 +1,80 @@
 import os
-from os.path import exists, join
+import re
+import sys
+from fnmatch import translate
+from functools import lru_cache
+from os.path import join
 from typing import Dict, List, Optional, Tuple, Type, TypeVar, Union
 
 import pydantic
 import tomli
 
 from . import debug
+from .engine import ENGINES
+from .finder import CONFIG_FILE
+from .staging import STRATEGIES
 
 T = TypeVar("T", bound="CoconutConfig")
 PathLike = Union[str, os.PathLike]
 
-DEFAULT_CONFIG_FILE = "pyproject.toml"
+DEFAULT_CONFIG_FILE = CONFIG_FILE
 TOOL_NAME = "coconut"
+BUILD_DIR = "build"
+STATE_DIR = ".setuptools-coconut"
+CACHE_ENV_VAR = "SETUPTOOLS_COCONUT_CACHE_DIR"
+LAZY_ENV_VAR = "SETUPTOOLS_COCONUT_LAZY"
+SKIP_TYPECHECK_ENV_VAR = "SETUPTOOLS_COCONUT_SKIP_TYPECHECK"
+MYPY_MODES = ("coconut", "cache", "daemon")
+INVALIDATION_MODES = ("timestamp", "checked-hash", "unchecked-hash")
+OPTIMIZE_LEVELS = (0, 1, 2)
+DEFAULT_EXCLUDE = (
+    "__pycache__",
+    "*.egg-info",
+    ".git",
+    ".hg",
+    ".mypy_cache",
+    ".pytest_cache",
+)
+
+
+class Override(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid):
+    """Compiler options for a subset of the files
+    (see :attr:`CoconutConfig.overrides`). Options that are not given keep the
+    project-wide value.
+    """
+
+    paths: Tuple[str, ...]
+    """Patterns (in the :mod:`fnmatch` syntax) matched against the path of each
+    ``.coco`` file relative to the project root (using ``/`` as separator),
+    e.g. ``"src/pkg/numeric/*"``.
+    """
+
+    target: Optional[str] = None
+    strict: Optional[bool] = None
+    tco: Optional[bool] = None
+    wrap: Optional[bool] = None
+
+    def options(self) -> Dict[str, object]:
+        """Options changed by this override"""
+        return self.dict(exclude={"paths"}, exclude_none=True)
+
+    def compiler_options(self) -> Dict[str, object]:
+        """Subset of :meth:`CoconutConfig.compiler_options` changed by this override"""
+        opts = {
+            "target": self.target,
+            "strict": self.strict,
+            "no_tco": None if self.tco is None else not self.tco,
+            "no_wrap": None if self.wrap is None else not self.wrap,
+        }
+        return {k: v for k, v in opts.items() if v is not None}
+
+    def matches(self, path: str) -> bool:
+        return _pattern(self.paths).match(path.replace(os.sep, "/")) is not None
+
+
+@lru_cache(maxsize=None)
+def _pattern(paths: Tuple[str, ...]) -> "re.Pattern":
+    return re.compile("|".join(map(translate, paths)) or "(?!)")
 
 
 class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid):
@@ -79,6 +142,28 @@ class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid
     <https://mypy.readthedocs.io/en/stable/config_file.html>`_
     """
 
+    mypy_mode: str = "coconut"
+    """How the type check is performed when ``mypy`` is enabled:
+
+    - ``"coconut"``: ``coconut --mypy`` checks the compiled files from scratch.
+    - ``"cache"``: the plugin runs ``mypy`` after compilation, with a persistent
+      cache (stored in the :meth:`state_dir`), so only modified modules (and the
+      ones that depend on them) are rechecked.
+    - ``"daemon"``: the plugin uses the ``mypy`` daemon (``dmypy``), which is kept
+      running between builds (``"cache"`` is used when ``dmypy`` is not available).
+
+    See :mod:`setuptools_coconut.typecheck`.
+    """
+
+    mypy_background: bool = False
+    """Run the type check (``"cache"`` or ``"daemon"`` modes) in the background,
+    concurrently with the rest of the build, and collect its result at the end.
+    Type errors make the build fail when the ``setuptools_coconut.build_meta``
+    backend is used, otherwise they are only reported.
+    The type check can also run separately with
+    ``python -m setuptools_coconut check``.
+    """
+
     processes: Union[int, str] = "sys"
     """Number of processes to use. When ``"sys"`` is passed, ``coconut`` will
     try to automatically detect the number of cores in the machine.
@@ -87,6 +172,120 @@ class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid
     argv: Tuple[str, ...] = ()
     """Extra arguments passed directly to the ``coconut`` compilation script"""
 
+    cache: bool = False
+    """Keep compiled files in a cache shared by all projects of the current user
+    (by default in ``~/.cache/setuptools-coconut``, see
+    :func:`user_cache_dir`), so they don't need to be compiled again.
+    The cache is not used when ``mypy`` is enabled with ``mypy_mode = "coconut"``.
+    """
+
+    cache_size: int = 512
+    """Maximum size of the shared cache (in MB).
+    The least recently used entries are removed when it grows beyond that limit.
+    """
+
+    batch: bool = True
+    """Compile all the ``src`` folders in a single invocation of the compiler
+    (sharing the same pool of ``processes``), instead of one after the other.
+    """
+
+    engine: str = "subprocess"
+    """How the ``coconut`` compiler is invoked:
+
+    - ``"subprocess"``: a new Python interpreter is spawned for running
+      ``python -m coconut``.
+    - ``"inprocess"``: ``coconut`` is imported and executed in the same process
+      as ``setuptools``. This avoids paying the startup cost (interpreter + grammar
+      construction) every time the compiler runs.
+    - ``"server"``: compilation requests are sent to a long-lived local server
+      (started with ``python -m setuptools_coconut server``), which keeps the
+      compiler "warm" between builds. When the server is not running, the
+      ``"subprocess"`` engine is used instead.
+    """
+
+    exclude: Tuple[str, ...] = DEFAULT_EXCLUDE
+    """Patterns (in the :mod:`fnmatch` syntax) for files and directories inside
+    of ``src`` that should not be copied/linked into ``dest``.
+    Patterns are matched against both the name and the path relative to ``src``
+    (using ``/`` as separator). Excluded directories are not traversed.
+    """
+
+    staging: str = "auto"
+    """How non-compiled files (e.g. ``package_data``) are placed inside of ``dest``:
+    ``"symlink"``, ``"reflink"`` (copy-on-write clone, when supported by the file
+    system), ``"hardlink"`` or ``"copy"``.
+    If the chosen strategy is not supported, the following ones are attempted
+    (in the order given above). ``"auto"`` is the same as ``"symlink"``.
+    Files are staged in parallel, using a pool of threads.
+    """
+
+    scheduler: bool = False
+    """Compile each modified file individually, in a pool of ``processes``
+    workers, starting with the largest files (instead of letting ``coconut``
+    distribute them). This keeps all workers busy until the end of the build,
+    even when a few modules are much larger than the others.
+    Workers always compile in-process, regardless of ``engine``.
+    This option has no effect when ``mypy`` is enabled with
+    ``mypy_mode = "coconut"``.
+    """
+
+    bytecode: bool = False
+    """Byte-compile the generated ``.py`` files into ``__pycache__`` (using the
+    Python interpreter running the build), and include the ``.pyc`` files in the
+    distribution. This way, the installed modules can be imported for the first
+    time without writing to ``__pycache__``. Files are compiled in parallel
+    (according to ``processes``). Requires Python 3.7 or later (:pep:`552`).
+
+    The ``.pyc`` files are added to the data files of each package by the plugin
+    (see :class:`~setuptools_coconut.stream.BytecodeMixin`), so there is no need to
+    list them in ``package_data``.
+    """
+
+    optimize: Tuple[int, ...] = (0,)
+    """Optimization levels used when ``bytecode`` is enabled (one ``.pyc`` file is
+    generated for each level, see :option:`python -O <-O>`).
+    """
+
+    invalidation_mode: str = "checked-hash"
+    """How the ``.pyc`` files are validated against the ``.py`` files when imported
+    (see :pep:`552`): ``"checked-hash"``, ``"unchecked-hash"`` or ``"timestamp"``.
+    Installers do not preserve modification times, so ``"timestamp"`` pycs are
+    usually considered stale (and rewritten) after installation.
+    """
+
+    shared_runtime: bool = False
+    """Compiled modules import the ``coconut`` runtime (``__coconut__.py``, written
+    once for each top-level package) with a plain relative import, instead of the
+    loader generated by ``coconut``, which manipulates :obj:`sys.path` every time a
+    module is imported. This reduces both the size of the compiled files and the
+    time spent importing them. Modules that are not part of a regular package
+    keep the original loader (see :mod:`setuptools_coconut.runtime`).
+    """
+
+    stream_wheel: bool = False
+    """When wheels are built with the ``setuptools_coconut.build_meta`` backend,
+    the generated files (compiled modules, ``__coconut__.py`` and ``.pyc``) are
+    added directly to the archive, instead of being copied by ``setuptools`` to
+    its intermediate build directories first (see
+    :mod:`setuptools_coconut.stream`). Other files are not affected.
+    """
+
+    overrides: Tuple[Override, ...] = ()
+    """Different compiler options (``target``, ``strict``, ``tco`` and ``wrap``)
+    for the files matching some ``paths``, e.g. to disable ``tco`` (and its
+    overhead) only in performance sensitive modules:
+
+    .. code-block:: toml
+
+       [[tool.coconut.overrides]]
+       paths = ["src/pkg/numeric/*"]
+       tco = false
+
+    When a file matches several overrides, the last one takes precedence.
+    Files with the same effective options are compiled together. The
+    ``__coconut__.py`` header always corresponds to the project-wide options.
+    """
+
     @pydantic.validator("dest")
     def dest_cannot_be_src(cls, v, values, **kwargs):
         if any(v == src for src in values["src"]):
@@ -95,24 +294,100 @@ class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid
             raise ValueError("To avoid recursion `dest` cannot be the same as `src`")
         return v
 
+    @pydantic.validator("engine")
+    def valid_engine(cls, v):
+        if v not in ENGINES:
+            raise ValueError(f"`engine` should be one of {list(ENGINES)!r}")
+        return v
+
+    @pydantic.validator("staging")
+    def valid_staging(cls, v):
+        if v != "auto" and v not in STRATEGIES:
+            raise ValueError(f"`staging` should be one of {['auto', *STRATEGIES]!r}")
+        return v
+
+    @pydantic.validator("mypy_mode")
+    def valid_mypy_mode(cls, v):
+        if v not in MYPY_MODES:
+            raise ValueError(f"`mypy_mode` should be one of {list(MYPY_MODES)!r}")
+        return v
+
+    @pydantic.validator("bytecode")
+    def bytecode_requires_py37(cls, v):
+        if v and sys.version_info[:2] < (3, 7):
+            raise ValueError("`bytecode` requires Python 3.7 or later")
+        return v
+
+    @pydantic.validator("optimize", each_item=True)
+    def valid_optimize(cls, v):
+        if v not in OPTIMIZE_LEVELS:
+            raise ValueError(
+                f"`optimize` levels should be in {list(OPTIMIZE_LEVELS)!r}"
+            )
+        return v
+
+    @pydantic.validator("invalidation_mode")
+    def valid_invalidation_mode(cls, v):
+        if v not in INVALIDATION_MODES:
+            modes = list(INVALIDATION_MODES)
+            raise ValueError(f"`invalidation_mode` should be one of {modes!r}")
+        return v
+
+    def workers(self) -> Optional[int]:
+        """Number of processes for the work distributed by the plugin itself,
+        e.g. ``bytecode`` and ``scheduler`` (``None`` => all cores).
+        """
+        return None if self.processes == "sys" else max(int(self.processes), 1)
+
     def as_cli_args(self) -> List[str]:
         args = ["--target", self.target, "-j", str(self.processes)]
         flags = {
             "--no-tco": self.tco is False,
             "--no-wrap": self.wrap is False,
             "--strict": self.strict,
-            "--mypy": self.mypy,
+            "--mypy": self.mypy and self.mypy_mode == "coconut",
+            # Same output as --mypy (type checking is done by the plugin)
+            "--line-numbers": self.mypy and self.mypy_mode != "coconut",
         }
         args.extend(k for k, v in flags.items() if v)
         if self.argv:
             args.extend(self.argv)
         return args
 
+    def compiler_options(self) -> Dict[str, object]:
+        """Equivalent of :meth:`as_cli_args` for ``coconut``'s Python API
+        (:meth:`coconut.compiler.Compiler.setup`). ``argv`` is not taken into
+        consideration.
+        """
+        return {
+            "target": self.target,
+            "strict": self.strict,
+            "no_tco": not self.tco,
+            "no_wrap": not self.wrap,
+        }
+
+    def for_file(self: T, path: str) -> T:
+        """Effective options for a ``.coco`` file (``path`` should be relative to
+        the project root), according to the :attr:`overrides`.
+        """
+        update: Dict[str, object] = {}
+        for override in self.overrides:
+            if override.matches(path):
+                update.update(override.options())
+        return self.copy(update=update) if update else self
+
     def build_paths(self) -> Dict[str, str]:
         if self.dest is None:
             return {s: s for s in self.src}
         return {s: join(self.dest, s) for s in self.src}
 
+    def state_dir(self) -> str:
+        """Folder (relative to the project root) where information about previous
+        builds is kept (e.g. for incremental compilation).
+        When ``dest`` is not set, ``build`` is used.
+        """
+        return join(self.dest or BUILD_DIR, STATE_DIR)
+
     @classmethod
     def from_file(cls: Type[T], file: PathLike) -> Optional[T]:
         """Reads the configuration from a file in the same format as ``pyproject.toml``
@@ -120,16 +395,33 @@ class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid
 
         The configurations for the ``coconut`` compiler should be stored in the
         ``tool.coconut`` table.
+
+        The validated configuration is kept in memory and reused while the file is
+        not modified (``setuptools`` may ask for it many times during a build).
         """
-        coconut_config = None
-        if file and exists(file):
-            with open(file, "rb") as f:
-                config = tomli.load(f)
-            coconut_config = config.get("tool", {}).get(TOOL_NAME, None)
-        else:
+        try:
+            st = os.stat(file)
+        except (OSError, TypeError, ValueError):
             debug.print(f"No configuration file: `{file}`")
             return None
 
+        key = (cls, os.path.abspath(file))
+        stamp = (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+        snapshot = _snapshots.get(key)
+        if snapshot and snapshot[0] == stamp:
+            return snapshot[1]  # type: ignore[return-value]
+
+        with debug.span("config", file=str(file)):
+            config = cls._read(file)
+        _snapshots[key] = (stamp, config)
+        return config
+
+    @classmethod
+    def _read(cls: Type[T], file: PathLike) -> Optional[T]:
+        with open(file, "rb") as f:
+            config = tomli.load(f)
+        coconut_config = config.get("tool", {}).get(TOOL_NAME, None)
+
         if coconut_config is None:
             debug.print(f"No table [tool.{TOOL_NAME}] found in `{file!r}`")
             return None
@@ -140,6 +432,20 @@ class CoconutConfig(pydantic.BaseModel, frozen=True, extra=pydantic.Extra.forbid
             raise ValidationError(file, ex)
 
 
+_snapshots: Dict[Tuple[type, str], Tuple[Tuple[int, ...], Optional[CoconutConfig]]] = {}
+
+
+def user_cache_dir() -> str:
+    """Directory where ``setuptools-coconut`` stores files shared by all projects
+    of the current user. It can be changed via the ``SETUPTOOLS_COCONUT_CACHE_DIR``
+    environment variable.
+    """
+    if os.getenv(CACHE_ENV_VAR):
+        return os.environ[CACHE_ENV_VAR]
+    base = os.getenv("XDG_CACHE_HOME") or join(os.path.expanduser("~"), ".cache")
+    return join(base, "setuptools-coconut")
+
+
 class ValidationError(pydantic.ValidationError):
     __slots__ = ("file", "__cause__")
 
@@ -153,4 +459,4 @@ class ValidationError(pydantic.ValidationError):
         return msg + super().__str__()
 
 
-__all__ = ["CoconutConfig", "ValidationError"]
+__all__ = ["CoconutConfig", "Override", "ValidationError"]
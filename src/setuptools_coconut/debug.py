@@ -1,5 +1,11 @@
+import atexit
+import json
 import os
 import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator
 
 from . import dist_name
 
@@ -30,3 +36,64 @@ def inspect(arg):
 def lazy(fn, *args, **kwargs):
     if DEBUG:
         print(fn(*args, **kwargs))
+
+
+TRACE = os.getenv("SETUPTOOLS_COCONUT_TRACE")
+"""File where timing information is recorded (disabled when not set).
+Files ending in ``.json`` use the `Chrome trace event format
+<https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU>`_
+(they can be opened in ``chrome://tracing`` or https://ui.perfetto.dev),
+other files receive one JSON object per line (in both formats, the attributes
+given to :func:`span` are stored under ``"args"``).
+Multiple processes can write to the same file.
+"""
+
+_trace_lock = threading.Lock()
+_trace_file: Dict[str, IO[str]] = {}
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """Record how long the ``with`` block takes (when :obj:`TRACE` is set).
+    The yielded dict can be used for adding attributes from inside of the block.
+    """
+    if not TRACE:
+        yield attrs
+        return
+
+    start, counter = time.time(), time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        duration = time.perf_counter() - counter
+        _record(TRACE, name, start, duration, attrs)
+
+
+def _record(file: str, name: str, start: float, duration: float, attrs: dict):
+    chrome = file.endswith(".json")
+    pid, tid = os.getpid(), threading.get_ident()
+    if chrome:
+        event = {"name": name, "cat": dist_name, "ph": "X", "pid": pid, "tid": tid}
+        event.update(ts=start * 1e6, dur=duration * 1e6, args=attrs)
+    else:
+        event = {"name": name, "start": start, "duration": duration, "pid": pid}
+        event.update(tid=tid, args=attrs)
+    line = json.dumps(event, default=str) + (",\n" if chrome else "\n")
+
+    with _trace_lock:
+        if file not in _trace_file:
+            os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+            stream = _trace_file[file] = open(file, "a", encoding="utf-8")
+            if chrome and stream.tell() == 0:
+                # The closing bracket is optional in the JSON Array Format
+                stream.write("[\n")
+        _trace_file[file].write(line)
+        _trace_file[file].flush()
+
+
+@atexit.register
+def _close_trace():
+    with _trace_lock:
+        for stream in _trace_file.values():
+            stream.close()
+        _trace_file.clear()
@@ -0,0 +1,233 @@
+"""Lazy compilation of ``.coco`` modules for editable installs (:pep:`660`).
+
+This module is copied (as a standalone file) into the wheels produced by
+:func:`setuptools_coconut.build_meta.build_editable`, together with a ``.pth`` file
+that calls :func:`install` when the interpreter starts.
+Therefore it should only depend on the standard library (``coconut`` itself is
+only imported when a ``.coco`` module needs to be compiled).
+
+The installed :class:`CoconutFinder` looks for ``.coco`` files in the ``src``
+folders of the project. When one of them is imported, it is compiled into the
+correspondent location in ``dest`` (exactly where a regular build would place it),
+unless the compiled file is already up to date: similarly to ``__pycache__``,
+compiled files have the same modification time as their sources. The compiler
+options and the ``coconut`` version used for each file are also recorded (in a
+JSON file inside of the project's state folder), so the files are recompiled when
+they change.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from importlib.machinery import ModuleSpec, SourceFileLoader
+from importlib.util import spec_from_file_location
+from os.path import dirname, exists, isdir, join
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+COCONUT_EXTENSIONS = (".coco", ".coconut", ".coc")
+HEADER_FILE = "__coconut__.py"
+
+
+Override = Tuple[Sequence[str], Dict[str, Any]]
+
+
+class CoconutFinder:
+    def __init__(
+        self,
+        paths: Dict[str, str],
+        options: Dict[str, Any],
+        overrides: Sequence[Override] = (),
+        state: Optional[str] = None,
+    ):
+        self.paths = paths
+        """Absolute ``src`` folders mapped into the correspondent ``dest``"""
+        self.options = options
+        """Keyword arguments for :meth:`coconut.compiler.Compiler.setup`"""
+        self.overrides = overrides
+        """``(patterns, options)`` replacing some of the :attr:`options` for the
+        sources whose absolute paths (using ``/``) match one of the ``patterns``
+        """
+        self.state = state
+        """JSON file where the :meth:`signature` of each compiled file is recorded
+        (when not given, only the modification times are compared)
+        """
+        self._dest_to_src = {os.path.normcase(d): s for s, d in paths.items()}
+        self._compilers: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._headers: Dict[str, bool] = {}
+        self._signatures: Optional[Dict[str, str]] = None
+
+    def _src_dirs(self, path: Optional[Sequence[str]]) -> List[Tuple[str, str]]:
+        """``(src, dest)`` pairs of directories that may contain the module"""
+        if path is None:
+            return list(self.paths.items())
+        dirs = []
+        for entry in path:
+            for dest_root, src_root in self._dest_to_src.items():
+                rel = os.path.relpath(os.path.normcase(entry), dest_root)
+                if not rel.startswith(os.pardir):
+                    dirs.append((join(src_root, rel), entry))
+        return dirs
+
+    def find_spec(self, fullname: str, path=None, target=None) -> Optional[ModuleSpec]:
+        name = fullname.rpartition(".")[2]
+        for src_dir, dest_dir in self._src_dirs(path):
+            for ext in COCONUT_EXTENSIONS:
+                package = join(src_dir, name, f"__init__{ext}")
+                if exists(package):
+                    output = join(dest_dir, name, "__init__.py")
+                    self.compile(package, output)
+                    locations = [join(dest_dir, name)]
+                    return self._spec(fullname, output, locations)
+                module = join(src_dir, f"{name}{ext}")
+                if exists(module):
+                    output = join(dest_dir, f"{name}.py")
+                    self.compile(module, output)
+                    return self._spec(fullname, output, None)
+        return None
+
+    def _spec(self, fullname, output, locations) -> Optional[ModuleSpec]:
+        loader = SourceFileLoader(fullname, output)
+        return spec_from_file_location(
+            fullname, output, loader=loader, submodule_search_locations=locations
+        )
+
+    def compile(self, source: str, output: str):
+        """Compile ``source`` into ``output`` (if ``output`` is not up to date)"""
+        src_stat = os.stat(source)
+        options = self.options_for(source)
+        try:
+            same_mtime = os.stat(output).st_mtime_ns == src_stat.st_mtime_ns
+        except OSError:
+            same_mtime = False
+        if same_mtime and self.state is None:
+            return
+        signature = self.signature(options)
+        if same_mtime and self._load_signatures().get(output) == signature:
+            return
+
+        level = package_level(source)
+        with self._lock:
+            compiler = self.compiler(options)
+            with open(source, "r", encoding="utf-8") as f:
+                code = compiler.parse_package(f.read(), package_level=level)
+            _write(output, code)
+            os.utime(output, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+            self._save_signature(output, signature)
+            header_dir = output
+            for _ in range(level + 1):
+                header_dir = dirname(header_dir)
+            self._write_header(join(header_dir, HEADER_FILE))
+
+    def signature(self, options: Dict[str, Any]) -> str:
+        """Everything besides the contents of the source that can influence the
+        output (similarly to :func:`setuptools_coconut.manifest.signature`)
+        """
+        contents = {"coconut": coconut_version(), "options": options}
+        return hashlib.sha256(json.dumps(contents, sort_keys=True).encode()).hexdigest()
+
+    def _load_signatures(self) -> Dict[str, str]:
+        with self._lock:
+            if self._signatures is None:
+                self._signatures = _read_json(self.state) if self.state else {}
+            return self._signatures
+
+    def _save_signature(self, output: str, signature: str):
+        if not self.state:
+            return
+        with self._lock:
+            # Other processes might have compiled different files in the meantime
+            self._signatures = {**_read_json(self.state), output: signature}
+            _write(self.state, json.dumps(self._signatures, indent=0, sort_keys=True))
+
+    def options_for(self, source: str) -> Dict[str, Any]:
+        path = source.replace(os.sep, "/")
+        options = dict(self.options)
+        for patterns, override in self.overrides:
+            if any(fnmatchcase(path, p) for p in patterns):
+                options.update(override)
+        return options
+
+    def compiler(self, options: Optional[Dict[str, Any]] = None):
+        options = self.options if options is None else options
+        key = json.dumps(options, sort_keys=True)
+        if key not in self._compilers:
+            from coconut.compiler import Compiler
+
+            compiler = Compiler()
+            compiler.setup(**options)
+            self._compilers[key] = compiler
+        return self._compilers[key]
+
+    def _write_header(self, file: str):
+        if self._headers.get(file):
+            return
+        # Same as a regular build: the header uses the project-wide options
+        header = self.compiler().getheader("__coconut__")
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                up_to_date = f.read() == header
+        except OSError:
+            up_to_date = False
+        if not up_to_date:
+            _write(file, header)
+        self._headers[file] = True
+
+
+def package_level(file: str) -> int:
+    """Mirrors how ``coconut`` determines the depth of a file inside its package"""
+    level = -1
+    directory = dirname(os.path.abspath(file))
+    while any(exists(join(directory, f"__init__{e}")) for e in COCONUT_EXTENSIONS):
+        level += 1
+        parent = dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return max(level, 0)
+
+
+@lru_cache(maxsize=None)
+def coconut_version() -> str:
+    try:
+        from importlib.metadata import version
+    except ImportError:  # pragma: no cover
+        from coconut.root import VERSION
+
+        return VERSION
+    return version("coconut")
+
+
+def _read_json(file: str) -> Dict[str, Any]:
+    try:
+        with open(file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(file: str, contents: str):
+    if not isdir(dirname(file)):
+        os.makedirs(dirname(file), exist_ok=True)
+    tmp = f"{file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(contents)
+    os.replace(tmp, file)
+
+
+def install(config: Dict[str, Any]) -> CoconutFinder:
+    """Add a :class:`CoconutFinder` to :obj:`sys.meta_path`.
+    ``config`` should contain the ``paths``, ``options`` and (optionally)
+    ``overrides`` and ``state`` of the finder.
+    """
+    finder = CoconutFinder(
+        config["paths"],
+        config["options"],
+        config.get("overrides", ()),
+        config.get("state"),
+    )
+    sys.meta_path.insert(0, finder)
+    return finder
@@ -0,0 +1,141 @@
+"""Different strategies for running the ``coconut`` compiler.
+
+An engine is simply a callable that receives the same arguments as the ``coconut``
+command line and returns its output, raising :exc:`subprocess.CalledProcessError`
+when the compilation fails.
+"""
+import io
+import os
+import sys
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from functools import lru_cache
+from subprocess import STDOUT, CalledProcessError, check_output
+from typing import Callable, Dict, Sequence
+
+from . import debug
+
+EXECUTABLE = (sys.executable, "-m", "coconut")
+
+Engine = Callable[[Sequence[str]], str]
+
+
+def run_cmd(cmd):
+    try:
+        return check_output(
+            cmd,
+            stderr=STDOUT,
+            universal_newlines=True,
+        )
+    except CalledProcessError as ex:  # pragma: no cover
+        print(debug.format("Error for command", " ".join(cmd), "\n", ex.output))
+        raise
+
+
+def run_subprocess(args: Sequence[str]) -> str:
+    """Spawn a new Python interpreter for running ``coconut``"""
+    return run_cmd([*EXECUTABLE, *args])
+
+
+def run_inprocess(args: Sequence[str]) -> str:
+    """Run ``coconut`` using its Python API, in the current process.
+
+    The grammar used by the compiler is built only once per process (which is
+    the most expensive part of running ``coconut`` for small projects), so
+    subsequent calls are considerably faster.
+    """
+    from coconut.command import Command
+
+    _warm_up()
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output), no_input(), isolated():
+        try:
+            # A new command avoids state leaking from one call to the other
+            Command().cmd(list(args), interact=False)
+            code = 0
+        except SystemExit as ex:
+            code = ex.code if isinstance(ex.code, int) else 1
+
+    if code:
+        raise compilation_error(args, code, output.getvalue())
+
+    return output.getvalue()
+
+
+def compilation_error(args: Sequence[str], code: int, output: str):
+    """Report a failed compilation the same way :func:`run_cmd` does"""
+    cmd = [*EXECUTABLE, *args]
+    print(debug.format("Error for command", " ".join(cmd), "\n", output))
+    return CalledProcessError(code, cmd, output)
+
+
+def run_server(args: Sequence[str]) -> str:
+    """Send a compilation request to the local server
+    (see :mod:`setuptools_coconut.server`), falling back to :func:`run_subprocess`
+    when the server is not available.
+    """
+    from .server import ServerUnavailable, request
+
+    try:
+        return request(args)
+    except ServerUnavailable as ex:
+        debug.print(f"{ex}, falling back to subprocess")
+        return run_subprocess(args)
+
+
+@lru_cache()
+def _warm_up():
+    """The grammar is lazily initialised during the first compilation.
+    When ``coconut`` uses multiple processes (``-j``), this happens in each worker,
+    for every run. Initialising it in the parent beforehand means that forked
+    workers can reuse it.
+    """
+    import multiprocessing
+
+    method = multiprocessing.get_start_method(allow_none=True)
+    if (method or multiprocessing.get_all_start_methods()[0]) == "fork":
+        from coconut.compiler import Compiler
+
+        Compiler().parse_package("pass\n")
+
+
+@contextmanager
+def no_input():
+    """``coconut`` executes any code piped via ``stdin`` (on Windows, it reads
+    ``stdin`` whenever it is not a terminal). To avoid that, its check for piped
+    input is disabled, and ``stdin`` is replaced with :obj:`os.devnull` (so nothing
+    can block, even if it is read).
+    """
+    from coconut.command import command
+
+    original = sys.stdin, command.stdin_readable
+    try:
+        with open(os.devnull, "r") as sys.stdin:
+            command.stdin_readable = lambda: False
+            yield
+    finally:
+        sys.stdin, command.stdin_readable = original
+
+
+@contextmanager
+def isolated():
+    """Restore the global state that ``coconut`` changes according to the command
+    line arguments (the verbosity of its logger and the recursion limit), so it
+    does not leak into the process running the build.
+    """
+    from coconut.terminal import logger
+
+    flags = {f: getattr(logger, f) for f in ("quiet", "verbose", "tracing")}
+    recursion_limit = sys.getrecursionlimit()
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+        for flag, value in flags.items():
+            setattr(logger, flag, value)
+
+
+ENGINES: Dict[str, Engine] = {
+    "subprocess": run_subprocess,
+    "inprocess": run_inprocess,
+    "server": run_server,
+}
@@ -0,0 +1,77 @@
+"""Entry point for the ``setuptools.file_finders`` integration.
+
+``setuptools`` imports all the registered file finders when building *any* project,
+so this module is kept as lightweight as possible: expensive dependencies
+(e.g. ``pydantic`` and ``tomli``) are only imported via
+:mod:`setuptools_coconut.api` once a (quick) check suggests that the project has a
+``[tool.coconut]`` table in its ``pyproject.toml``.
+"""
+import os
+import sys
+from functools import lru_cache
+from os.path import abspath, dirname, exists, join
+from typing import Iterable, Optional
+
+from . import debug
+
+PROJECT_MARKERS = ("pyproject.toml", "setup.cfg", ".git", ".hg")
+CONFIG_FILE = "pyproject.toml"
+
+
+def discover_root(starting_point: Optional[str] = None) -> str:
+    """Find the project root based in the existence of one of the files in
+    :obj:`PROJECT_MARKERS` (if none is found, the starting point is returned).
+    """
+    return _discover_root(abspath(starting_point or os.getcwd()))
+
+
+@lru_cache(maxsize=64)
+def _discover_root(start: str) -> str:
+    """Markers are not expected to change during a build, so the result is cached
+    (``setuptools`` calls :func:`compiled_files` several times, from the same cwd).
+    """
+    current, parent = start, None
+
+    with debug.span("discover_root", path=start):
+        while current != parent:
+            # current == parent => root directory
+            if any(exists(join(current, m)) for m in PROJECT_MARKERS):
+                return current
+
+            current, parent = dirname(current), current
+
+    return start
+
+
+def may_have_config(file: str) -> bool:
+    """Quick check (without parsing ``file``) that can only return ``False``
+    for files that certainly have no ``[tool.coconut]`` table
+    (false positives are handled by :meth:`CoconutConfig.from_file`).
+    """
+    try:
+        with open(file, "rb") as f:
+            return b"coconut" in f.read()
+    except OSError:
+        return False
+
+
+def compiled_files(path: str = "") -> Iterable[str]:
+    """Lightweight wrapper for :func:`setuptools_coconut.api.compiled_files`"""
+    root = discover_root()
+    if not may_have_config(join(root, CONFIG_FILE)):
+        debug.print(f"No [tool.coconut] in {root!r}, skipping ...")
+        return
+
+    from .api import compiled_files as _compiled_files
+
+    yield from _compiled_files(path)
+
+
+def start_build(dist):
+    """Hook for ``setuptools.finalize_distribution_options``, called once for each
+    build (i.e. ``Distribution``): the results of previous builds, kept in memory by
+    long-lived processes (see :func:`setuptools_coconut.api.session`), are discarded.
+    """
+    api = sys.modules.get(f"{__package__}.api")
+    if api is not None:
+        api.session.cache_clear()
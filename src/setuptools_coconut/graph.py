@@ -0,0 +1,80 @@
+"""Import graph of the ``.coco`` modules inside of a ``src`` folder.
+
+Imports are found with regular expressions (without compiling the files), so the
+graph is an approximation: extra edges (e.g. from imports inside strings) only
+result in a few extra files being recompiled, while dynamic imports are ignored.
+"""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+IMPORT = re.compile(r"^[ \t]*import[ \t]+([\w. \t,]+)", re.M)
+FROM_IMPORT = re.compile(
+    r"^[ \t]*from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+(\([^)]*\)|[^\n#;]*)", re.M
+)
+ALIAS = re.compile(r"[ \t]+as[ \t]+\w+")
+
+
+def module_name(key: str, prefix: str = "") -> Tuple[str, bool]:
+    """Module name for a file (``key`` is the path relative to the ``src`` folder,
+    using ``/`` as separator), and whether it corresponds to a package.
+    """
+    parts = [p for p in prefix.split(".") if p]
+    *dirs, file = key.split("/")
+    stem = file.split(".")[0]
+    is_package = stem == "__init__"
+    return ".".join([*parts, *dirs, *([] if is_package else [stem])]), is_package
+
+
+def parse_imports(source: str, module: str, is_package: bool) -> List[str]:
+    """Absolute names of the modules (possibly) imported by ``source``"""
+    package = module if is_package else module.rpartition(".")[0]
+    imports: Set[str] = set()
+    for match in IMPORT.finditer(source):
+        modules = ALIAS.sub("", match.group(1)).split(",")
+        imports.update(m.strip() for m in modules if m.strip())
+    for match in FROM_IMPORT.finditer(source):
+        base = _resolve(match.group(1), package)
+        if base is None:
+            continue
+        names = ALIAS.sub("", match.group(2).strip("()")).replace("\n", ",")
+        members = [n.strip() for n in names.split(",") if n.strip()]
+        imports.add(base)
+        imports.update(f"{base}.{m}".lstrip(".") for m in members if m != "*")
+    return sorted(imports)
+
+
+def _resolve(name: str, package: str) -> Optional[str]:
+    level = len(name) - len(name.lstrip("."))
+    if not level:
+        return name
+    parts = package.split(".") if package else []
+    if level - 1 >= len(parts):
+        return None  # Beyond the top-level package
+    base = parts[: len(parts) - (level - 1)]
+    return ".".join([*base, name[level:]]).strip(".")
+
+
+def dependents(
+    imports: Mapping[str, Iterable[str]], modules: Mapping[str, str], changed: Set[str]
+) -> Set[str]:
+    """Keys of all the files that (directly or transitively) import one of the
+    ``changed`` files.
+
+    ``imports`` maps each file to the names of the modules it imports,
+    ``modules`` maps module names to the correspondent file.
+    """
+    reverse: Dict[str, Set[str]] = defaultdict(set)
+    for key, names in imports.items():
+        for name in names:
+            if name in modules:
+                reverse[modules[name]].add(key)
+
+    result: Set[str] = set()
+    pending = list(changed)
+    while pending:
+        for key in reverse.get(pending.pop(), ()):
+            if key not in result and key not in changed:
+                result.add(key)
+                pending.append(key)
+    return result
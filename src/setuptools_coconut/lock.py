@@ -0,0 +1,113 @@
+"""Inter-process lock that coordinates builds sharing the same ``dest``
+(e.g. ``tox -p`` or ``pip`` building several wheels from the same checkout).
+
+The first process to acquire the lock compiles the files, while the others wait.
+Once they acquire it, they find the manifests up to date and simply reuse the
+compiled files (instead of racing to write the same files).
+
+The lock is an advisory lock (``flock`` on POSIX, ``msvcrt.locking`` on Windows)
+held on a file inside the state dir, so it is automatically released if the
+process dies. It is re-entrant within the same process.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from os.path import abspath, join
+from typing import IO, Dict, Iterator, Optional
+
+from . import debug
+
+LOCK_FILE = "build.lock"
+
+if os.name == "nt":  # pragma: no cover
+    import msvcrt
+
+    def _try_lock(file: IO) -> bool:
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)  # type: ignore
+            return True
+        except OSError:
+            return False
+
+    def _lock(file: IO):
+        while True:  # LK_LOCK gives up after 10 attempts
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)  # type: ignore
+                return
+            except OSError:
+                continue
+
+    def _unlock(file: IO):
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)  # type: ignore
+
+else:
+    import fcntl
+
+    def _try_lock(file: IO) -> bool:
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _lock(file: IO):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(file: IO):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO] = None
+        self._count = 0
+        self._thread_lock = threading.RLock()
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._count == 0:
+            try:
+                self._acquire_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._count += 1
+
+    def _acquire_file(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file = open(self.path, "a+")
+        if not _try_lock(file):
+            debug.print(f"Waiting for a concurrent build ({self.path!r}) ...")
+            with debug.span("lock_wait", path=self.path):
+                _lock(file)
+        self._file = file
+
+    def release(self):
+        self._count -= 1
+        if self._count == 0 and self._file:
+            _unlock(self._file)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+_locks: Dict[str, FileLock] = {}
+_guard = threading.Lock()
+
+
+@contextmanager
+def build_lock(state_dir: str) -> Iterator[FileLock]:
+    """Hold the (per-process, shared) lock for the given state dir"""
+    path = abspath(join(state_dir, LOCK_FILE))
+    with _guard:
+        lock = _locks.setdefault(path, FileLock(path))
+    with lock:
+        yield lock
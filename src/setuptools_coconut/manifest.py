@@ -0,0 +1,249 @@
+"""Bookkeeping for incremental compilation.
+
+For each ``src`` folder, a small JSON file is stored in the build state directory
+(see :meth:`~setuptools_coconut.config.CoconutConfig.state_dir`) recording the
+content hash of every ``.coco`` file compiled, together with the arguments given
+to the compiler and the ``coconut`` version.
+This way, subsequent builds only need to compile files that were modified (or
+added) since the last time.
+
+The manifest also lists all the files generated by the compiler, so they can be
+found without scanning the destination folder, and the modules imported by each
+file (see :mod:`~setuptools_coconut.graph`). When ``mypy`` is enabled, files that
+import a modified module are also recompiled, so they are type checked again
+(without ``mypy``, the output of a file does not depend on the modules it imports).
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+from glob import escape as glob_escape
+from glob import glob
+from os.path import (
+    abspath,
+    basename,
+    dirname,
+    exists,
+    join,
+    normpath,
+    relpath,
+    splitext,
+)
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import debug
+from .graph import dependents, module_name, parse_imports
+
+if sys.version_info[:2] >= (3, 8):
+    # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
+    from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
+else:
+    from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
+
+MANIFEST_VERSION = 3
+COCONUT_EXTENSIONS = (".coco", ".coconut", ".coc")
+HEADER_FILE = "__coconut__.py"
+FORCE_FLAGS = ("--force", "-f")
+
+Entry = Dict[str, Any]
+
+
+def coconut_version() -> str:
+    try:
+        return version("coconut")
+    except PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
+def signature(opts: List[str]) -> Dict[str, object]:
+    """Everything besides the contents of the files that can influence the output
+    of the compiler.
+    """
+    return {"version": MANIFEST_VERSION, "coconut": coconut_version(), "args": opts}
+
+
+def forced(opts: Iterable[str]) -> bool:
+    """``True`` if the compiler was explicitly asked to recompile all the files"""
+    return any(f in FORCE_FLAGS for f in opts)
+
+
+def manifest_file(state_dir: str, src: str) -> str:
+    name = re.sub(r"[^\w.-]+", "_", normpath(src).replace(os.sep, "/"))
+    return join(state_dir, f"{name}.json")
+
+
+def remove_output(file: str):
+    """Remove a file generated by the compiler (and its ``.pyc`` files).
+    Files without the comment added by ``coconut`` are kept (e.g. a module that
+    replaced the source, when compiling in-place).
+    """
+    try:
+        with open(file, "rb") as f:
+            if b"# Compiled with Coconut version" not in f.read(4096):
+                return
+        os.remove(file)
+    except OSError:
+        return
+    stem = splitext(basename(file))[0]
+    for pyc in glob(join(dirname(file), "__pycache__", f"{glob_escape(stem)}.*.pyc")):
+        os.remove(pyc)
+    debug.print(f"Removed {file!r} (source no longer exists)")
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def package_prefix(src_root: str, extensions=COCONUT_EXTENSIONS) -> str:
+    """Name of the package corresponding to ``src_root`` (empty if it is not one)"""
+    names = ("__init__.py", *(f"__init__{ext}" for ext in extensions))
+    if any(exists(join(src_root, n)) for n in names):
+        return os.path.basename(abspath(src_root))
+    return ""
+
+
+def dest_file(src_file: str) -> str:
+    """Name of the Python file produced by ``coconut`` for ``src_file``
+    (mirrors the logic used internally by the compiler).
+    """
+    base, ext = splitext(splitext(src_file)[0])
+    return base + (ext or ".py")
+
+
+def coconut_files(src_root: str, extensions=COCONUT_EXTENSIONS) -> Iterator[str]:
+    """Files that ``coconut`` would compile when given ``src_root``.
+    Similarly to the compiler, hidden directories are skipped.
+    """
+    for directory, dirs, files in os.walk(src_root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        yield from (join(directory, f) for f in files if f.endswith(extensions))
+
+
+class Manifest:
+    """Hashes of the files compiled from ``src_root`` into ``dest_root``"""
+
+    def __init__(
+        self, file: str, src_root: str, dest_root: str, signature: Dict[str, object]
+    ):
+        self.file = file
+        self.src_root = src_root
+        self.dest_root = dest_root
+        self.signature = signature
+        self.entries: Dict[str, Entry] = {}
+        self._pending: Dict[str, Entry] = {}
+
+    @classmethod
+    def load(
+        cls, file: str, src_root: str, dest_root: str, signature: Dict[str, object]
+    ) -> "Manifest":
+        manifest = cls(file, src_root, dest_root, signature)
+        try:
+            with open(manifest.file, "r", encoding="utf-8") as f:
+                contents = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+
+        if contents.get("signature") != signature:
+            debug.print(f"Compilation parameters changed, ignoring {manifest.file!r}")
+            return manifest
+
+        manifest.entries = contents.get("files", {})
+        return manifest
+
+    def stale(self, files: Iterable[str]) -> List[Tuple[str, str]]:
+        """Filter the ``files`` that need to be (re-)compiled and return them
+        paired with the path of the correspondent Python file.
+        """
+        args: List[str] = self.signature.get("args", [])  # type: ignore[assignment]
+        force = forced(args)
+        mypy = "--mypy" in args
+        prefix = package_prefix(self.src_root)
+        stale: Dict[str, Tuple[str, str]] = {}
+        pairs: Dict[str, Tuple[str, str]] = {}
+        changed: Set[str] = set()
+        for file in files:
+            key = relpath(file, self.src_root).replace(os.sep, "/")
+            output = join(self.dest_root, dest_file(key))
+            pairs[key] = (file, output)
+            st = os.stat(file)
+            stat = {"mtime": st.st_mtime_ns, "size": st.st_size}
+            entry = self.entries.get(key)
+            if entry and all(entry.get(k) == v for k, v in stat.items()):
+                new_entry = {**entry}
+            else:
+                analysis = self._analyse(file, key, prefix, entry, mypy)
+                new_entry = {**analysis, **stat}
+            new_entry["outputs"] = [dest_file(key)]
+            self._pending[key] = new_entry
+            if force or not entry or entry["hash"] != new_entry["hash"]:
+                changed.add(key)
+            if key in changed or not exists(output):
+                stale[key] = (file, output)
+
+        if mypy:
+            removed = set(self.entries) - set(self._pending)
+            affected = self._dependents(changed | removed, prefix)
+            stale.update((k, pairs[k]) for k in sorted(affected) if k not in stale)
+        return list(stale.values())
+
+    def _analyse(
+        self, file: str, key: str, prefix: str, entry: Optional[Entry], mypy: bool
+    ) -> Entry:
+        with open(file, "rb") as f:
+            contents = f.read()
+        digest = hashlib.sha256(contents).hexdigest()
+        if entry and entry["hash"] == digest:
+            return {k: entry[k] for k in ("hash", "imports")}
+        if not mypy:  # Imports are only needed by :meth:`_dependents`
+            return {"hash": digest, "imports": []}
+        module, is_package = module_name(key, prefix)
+        source = contents.decode("utf-8", errors="replace")
+        return {"hash": digest, "imports": parse_imports(source, module, is_package)}
+
+    def _dependents(self, changed: Set[str], prefix: str) -> Set[str]:
+        """Files that need to be type checked again when the ``changed`` ones are
+        modified (``mypy`` only checks the files given to the compiler).
+        """
+        if not changed:
+            return set()
+        known = {**self.entries, **self._pending}
+        modules = {module_name(k, prefix)[0]: k for k in known}
+        imports = {k: e["imports"] for k, e in self._pending.items()}
+        return dependents(imports, modules, changed)
+
+    def commit(self):
+        """Record that all the files previously checked with :meth:`stale` are now
+        compiled (entries for files that no longer exist are dropped, together with
+        the files generated from them).
+        """
+        headers = {}
+        for entry in self._pending.values():
+            outputs = entry["outputs"]
+            header = posixpath.join(posixpath.dirname(outputs[0]), HEADER_FILE)
+            if header not in headers:
+                headers[header] = exists(join(self.dest_root, header))
+            if headers[header]:
+                outputs.append(header)
+        kept = {f for e in self._pending.values() for f in e["outputs"]}
+        for key in set(self.entries) - set(self._pending):
+            for output in self.entries[key]["outputs"]:
+                if output not in kept:
+                    remove_output(join(self.dest_root, output))
+        self.entries, self._pending = self._pending, {}
+
+    def outputs(self) -> List[str]:
+        """Absolute paths of all the files generated by the compiler"""
+        files = {f for e in self.entries.values() for f in e["outputs"]}
+        return [abspath(join(self.dest_root, f)) for f in sorted(files)]
+
+    def save(self):
+        os.makedirs(dirname(self.file), exist_ok=True)
+        contents = {"signature": self.signature, "files": self.entries}
+        tmp = f"{self.file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(contents, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.file)
+        debug.print(f"Manifest saved: {self.file!r}")
@@ -0,0 +1,66 @@
+"""Shared runtime for the modules of a package (see the ``shared_runtime`` option
+in :class:`~setuptools_coconut.config.CoconutConfig`).
+
+In "package mode", ``coconut`` writes the runtime (``__coconut__.py``) once for each
+top-level package, but every compiled module starts with a loader that temporarily
+adds the package folder to :obj:`sys.path`, imports ``__coconut__`` as a top-level
+module (re-labelling its contents) and lists the folder contents.
+This code runs every time a module is imported.
+
+When the runtime lives inside a regular package, that loader can be replaced by a
+plain relative import (e.g. ``from ..__coconut__ import *``), so all the modules
+share a single ``package.__coconut__`` module, and each compiled file is smaller.
+"""
+import re
+from os.path import dirname, isfile, join
+from typing import Iterable, Tuple
+
+from . import debug
+from .cache import package_level
+from .manifest import HEADER_FILE
+
+LOADER = re.compile(
+    r"^_coconut_file_dir = .*?^_coconut_sys\.path\.pop\(0\)\n", re.M | re.S
+)
+IMPORT = re.compile(r"^from __coconut__ import .*\n", re.M)
+HASH = re.compile(r"^# __coconut_hash__ = .*\n", re.M)
+
+
+def relative_imports(code: str, level: int) -> str:
+    """Replace the loader in the header of ``code`` by relative imports of the
+    runtime, ``level`` packages up (the code is returned unchanged if no loader is
+    found, e.g. for files compiled in "standalone mode").
+
+    ``coconut`` does not overwrite files with the same hash as the source, so the
+    hash is removed (otherwise the loader would not be restored if the option
+    is disabled).
+    """
+    match = LOADER.search(code)
+    if not match:
+        return code
+    dots = "." * (level + 1)
+    imports = IMPORT.findall(match.group(0))
+    replacement = "".join(i.replace("from ", f"from {dots}", 1) for i in imports)
+    code = code[: match.start()] + replacement + code[match.end() :]
+    return HASH.sub("", code, count=1)
+
+
+def share(pairs: Iterable[Tuple[str, str]]):
+    """Make the compiled outputs of the ``(source, output)`` pairs use the runtime of
+    their top-level package directly. Modules outside of regular packages are left
+    untouched.
+    """
+    for source, output in pairs:
+        level = package_level(source)
+        root = dirname(output)
+        for _ in range(level):
+            root = dirname(root)
+        if not (isfile(join(root, "__init__.py")) and isfile(join(root, HEADER_FILE))):
+            continue
+        with open(output, "r", encoding="utf-8") as f:
+            code = f.read()
+        new_code = relative_imports(code, level)
+        if new_code != code:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(new_code)
+            debug.print(f"Shared runtime: {output!r}")
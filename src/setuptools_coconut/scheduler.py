@@ -0,0 +1,80 @@
+"""Plugin-level scheduling for the compilation of individual files
+(see the ``scheduler`` option in :class:`~setuptools_coconut.config.CoconutConfig`).
+
+When ``coconut`` runs with ``-j``, it decides how files are distributed among its
+workers, and a single large module can end up being compiled last (while all the
+other workers are idle). Here each file is submitted separately to a pool of
+processes, largest first (a "longest processing time" schedule), so the total time
+approaches the total amount of work divided by the number of workers.
+
+Workers use :func:`~setuptools_coconut.engine.run_inprocess` (when possible, they
+are forked after the grammar is initialised, so it is built only once).
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from subprocess import CalledProcessError
+from typing import List, Optional, Sequence, Tuple
+
+from . import debug
+from .engine import _warm_up, run_inprocess
+
+Pair = Tuple[str, str]
+
+
+def schedule(pairs: Sequence[Pair]) -> List[Pair]:
+    """Order ``(source, output)`` pairs so the largest sources come first"""
+    return sorted(pairs, key=lambda pair: _size(pair[0]), reverse=True)
+
+
+def single_process(opts: Sequence[str]) -> List[str]:
+    """Replace the ``-j`` option, so each worker compiles a file by itself"""
+    args = list(opts)
+    for i, arg in enumerate(args[:-1]):
+        if arg in ("-j", "--jobs"):
+            args[i + 1] = "0"
+    return args
+
+
+def compile_files(pairs: Sequence[Pair], opts: Sequence[str], workers: Optional[int]):
+    """Compile each ``(source, output)`` pair with a separate call to ``coconut``.
+    When ``workers`` is not 1, files are distributed among a pool of processes.
+    If one or more files fail to compile, the first error is raised (after all the
+    other files are processed).
+    """
+    args = [*single_process(opts), "--package"]
+    order = schedule(pairs)
+    for directory in {os.path.dirname(output) for _, output in order}:
+        # Avoid a race condition in ``coconut`` when workers create the same dir
+        os.makedirs(directory, exist_ok=True)
+    if workers == 1 or len(order) < 2:
+        for source, output in order:
+            _compile(source, output, args)
+        return
+
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        _warm_up()  # Done in the parent, so forked workers inherit the grammar
+        context = multiprocessing.get_context("fork")
+    errors: List[CalledProcessError] = []
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [pool.submit(_compile, src, out, args) for src, out in order]
+        for future in futures:
+            try:
+                future.result()
+            except CalledProcessError as ex:
+                errors.append(ex)
+    if errors:
+        raise errors[0]
+
+
+def _compile(source: str, output: str, args: Sequence[str]) -> str:
+    with debug.span("compile_file", file=source):
+        return run_inprocess([source, output, *args])
+
+
+def _size(file: str) -> int:
+    try:
+        return os.stat(file).st_size
+    except OSError:
+        return 0
@@ -0,0 +1,133 @@
+"""Long-lived local compilation server.
+
+Building the ``coconut`` grammar is the most expensive step for small/medium
+projects, and it is repeated every time ``setuptools`` spawns a new process.
+The server keeps the compiler loaded in memory and answers requests sent via a Unix
+socket (one JSON object per line), so repeated builds don't have to pay for it.
+
+Start it with::
+
+    python -m setuptools_coconut server
+
+and set ``engine = "server"`` in the ``[tool.coconut]`` table of your
+``pyproject.toml``.
+"""
+import errno
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from os.path import dirname, exists, join
+from subprocess import CalledProcessError
+from typing import Optional, Sequence
+
+from . import debug
+from .config import user_cache_dir
+from .engine import compilation_error, run_inprocess
+from .manifest import coconut_version
+
+SOCKET_ENV_VAR = "SETUPTOOLS_COCONUT_SOCKET"
+CONNECT_TIMEOUT = 1
+
+
+class ServerUnavailable(Exception):
+    """The server is not running (or cannot handle the request)"""
+
+
+def default_socket() -> str:
+    return os.getenv(SOCKET_ENV_VAR) or join(user_cache_dir(), "server.sock")
+
+
+def request(args: Sequence[str], path: Optional[str] = None) -> str:
+    """Compile using the server listening at ``path``.
+    The same exceptions as :func:`~setuptools_coconut.engine.run_subprocess` are
+    raised for failed compilations.
+    """
+    msg = {"args": list(args), "cwd": os.getcwd(), "coconut": coconut_version()}
+    response = _send(msg, path or default_socket())
+    if response["returncode"]:
+        raise compilation_error(args, response["returncode"], response["output"])
+    return response["output"]
+
+
+def is_running(path: Optional[str] = None) -> bool:
+    try:
+        _send({"ping": True}, path or default_socket())
+        return True
+    except ServerUnavailable:
+        return False
+
+
+def _send(msg: dict, path: str) -> dict:
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover
+        raise ServerUnavailable("Unix sockets are not supported")
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(path)
+            sock.settimeout(None)
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps(msg).encode() + b"\n")
+                stream.flush()
+                response = json.loads(stream.readline())
+    except (OSError, ValueError) as ex:
+        raise ServerUnavailable(f"Compilation server not available at {path!r} ({ex})")
+
+    if "error" in response:
+        raise ServerUnavailable(response["error"])
+    return response
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        msg = json.loads(self.rfile.readline())
+        if msg.get("ping"):
+            return self._reply({"pong": True})
+        if msg.get("coconut") != coconut_version():
+            error = f"Server uses coconut {coconut_version()}, not {msg.get('coconut')}"
+            return self._reply({"error": error})
+
+        print(debug.format("Compiling:", *msg["args"]), flush=True)
+        cwd = os.getcwd()
+        try:
+            os.chdir(msg["cwd"])
+            output = run_inprocess(msg["args"])
+            self._reply({"returncode": 0, "output": output})
+        except CalledProcessError as ex:
+            self._reply({"returncode": ex.returncode, "output": ex.output})
+        finally:
+            os.chdir(cwd)
+
+    def _reply(self, response: dict):
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def create(path: Optional[str] = None) -> socketserver.BaseServer:
+    """Create a server (requests are handled one at a time)"""
+    path = path or default_socket()
+    if exists(path):
+        if is_running(path):
+            raise OSError(errno.EADDRINUSE, "Server already running", path)
+        os.unlink(path)  # Stale socket from a previous server
+
+    os.makedirs(dirname(path), exist_ok=True)
+    server = socketserver.UnixStreamServer(path, Handler)
+    os.chmod(path, 0o600)
+    return server
+
+
+def serve(path: Optional[str] = None):
+    """Start the server and block until it is interrupted"""
+    path = path or default_socket()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with create(path) as server:
+        print(debug.format(f"Listening on {path!r} (Ctrl+C to stop)"), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
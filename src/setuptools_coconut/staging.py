@@ -0,0 +1,85 @@
+"""Different strategies for placing the non-compiled files (e.g. ``package_data``)
+inside of ``dest``.
+
+A strategy is simply a callable that receives the original file and its
+destination (which should not exist yet) and raises :exc:`OSError` when it is
+not supported (e.g. by the operating system or the file system). In that case
+the next strategy in :obj:`STRATEGIES` is attempted.
+"""
+import os
+from shutil import copy2, copystat
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+FICLONE = 0x40049409  # From linux/fs.h: _IOW(0x94, 9, int)
+CHUNK_SIZE = 2**30
+
+Strategy = Callable[[str, str], None]
+
+
+def symlink(orig: str, dest: str):
+    os.symlink(orig, dest)
+
+
+def reflink(orig: str, dest: str):
+    """Copy-on-write clone of ``orig`` (only data blocks are shared, metadata is
+    independent). Uses the ``FICLONE`` ioctl when available (e.g. btrfs, XFS) or
+    ``copy_file_range`` (which avoids moving the data through user space and is
+    implemented with reflinks by some file systems).
+    """
+    try:
+        with open(orig, "rb") as src, open(dest, "wb") as dst:
+            try:
+                if fcntl is None:
+                    raise OSError("ioctl not available")
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                if not hasattr(os, "copy_file_range"):
+                    raise
+                _copy_range(src.fileno(), dst.fileno())
+    except OSError:
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        raise
+    copystat(orig, dest)
+
+
+def _copy_range(src: int, dst: int):
+    while os.copy_file_range(src, dst, CHUNK_SIZE):
+        pass
+
+
+def hardlink(orig: str, dest: str):
+    os.link(orig, dest)
+
+
+def copy(orig: str, dest: str):
+    copy2(orig, dest)
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "symlink": symlink,
+    "reflink": reflink,
+    "hardlink": hardlink,
+    "copy": copy,
+}
+
+
+def in_sync(orig: str, dest: str) -> bool:
+    """``True`` if ``dest`` is a symlink to ``orig``, a hard link to it or a copy
+    (same size and modification time, as preserved by :func:`shutil.copy2`).
+    """
+    try:
+        if os.path.islink(dest):
+            return os.readlink(dest) == orig
+        src_stat, dest_stat = os.stat(orig), os.stat(dest)
+    except OSError:
+        return False
+    return (src_stat.st_size, src_stat.st_mtime_ns) == (
+        dest_stat.st_size,
+        dest_stat.st_mtime_ns,
+    )
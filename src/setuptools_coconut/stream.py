@@ -0,0 +1,170 @@
+"""Integration with ``build_py`` for the generated files: ``.pyc`` files (see
+:class:`BytecodeMixin`) and streaming into wheels (see the ``stream_wheel`` option
+in :class:`~setuptools_coconut.config.CoconutConfig`).
+
+``setuptools`` copies every module into ``build/lib`` and then into a temporary
+directory, before reading it again to create the wheel. When
+:func:`setuptools_coconut.build_meta.build_wheel` streams the generated files,
+``build_py`` skips the modules and ``.pyc`` files produced by the plugin (only
+recording where they would be placed) and ``bdist_wheel`` adds them directly to the
+archive, from the ``dest`` folder where they were compiled, before writing the
+``RECORD`` file (see :class:`WheelMixin`).
+
+This module is registered as a ``setuptools.finalize_distribution_options`` entry
+point, which ``setuptools`` loads for *any* project, so (similarly to
+:mod:`~setuptools_coconut.finder`) other modules are only imported when needed.
+"""
+import os
+import sys
+from os.path import abspath, join, relpath
+from typing import Dict, Set
+
+STREAM_ENV_VAR = "SETUPTOOLS_COCONUT_STREAM"
+
+streamed: Dict[str, str] = {}
+"""Files skipped by ``build_py``: paths inside of the wheel => paths in disk"""
+
+
+def finalize_distribution_options(dist):
+    """Replace ``build_py`` for projects that enable the ``bytecode`` option, and
+    when :func:`setuptools_coconut.build_meta.build_wheel` requests the generated
+    files to be streamed.
+    """
+    streaming = os.getenv(STREAM_ENV_VAR) not in (None, "", "0", "false")
+    bytecode = _uses_bytecode()
+    if not (streaming or bytecode):
+        return
+    from setuptools.command.build_py import build_py
+
+    base = dist.cmdclass.get("build_py", build_py)
+    enabled = {StreamMixin: streaming, BytecodeMixin: bytecode}
+    mixins = tuple(m for m, on in enabled.items() if on and not issubclass(base, m))
+    if mixins:
+        dist.cmdclass["build_py"] = type("build_py", (*mixins, base), {})
+    if streaming:
+        base = dist.get_command_class("bdist_wheel")
+        if not issubclass(base, WheelMixin):
+            dist.cmdclass["bdist_wheel"] = type("bdist_wheel", (WheelMixin, base), {})
+
+
+class StreamMixin:
+    """Filter the generated files out of ``build_py`` (see :obj:`streamed`)"""
+
+    build_lib: str
+
+    def find_package_modules(self, package, package_dir):
+        modules = super().find_package_modules(package, package_dir)
+        generated = generated_files()
+        kept = []
+        for pkg, module, file in modules:
+            if _norm(file) in generated:
+                outfile = self.get_module_outfile(
+                    self.build_lib, pkg.split("."), module
+                )
+                _record(relpath(outfile, self.build_lib), file)
+            else:
+                kept.append((pkg, module, file))
+        return kept
+
+    def find_data_files(self, package, src_dir):
+        files = super().find_data_files(package, src_dir)
+        generated = generated_files()
+        kept = []
+        for file in files:
+            if _norm(file) in generated:
+                _record(join(*package.split("."), relpath(file, src_dir)), file)
+            else:
+                kept.append(file)
+        return kept
+
+
+class WheelMixin:
+    """Write the :obj:`streamed` files into the archive created by ``bdist_wheel``
+    (which only adds the contents of a temporary directory).
+
+    ``bdist_wheel`` creates the archive with the ``WheelFile`` class imported by its
+    module, so it is temporarily replaced by a subclass that adds the files (and
+    their hashes, which are included in the ``RECORD``).
+    Files that are written are removed from :obj:`streamed`.
+    """
+
+    def run(self):
+        module = next(
+            (
+                sys.modules[cls.__module__]
+                for cls in type(self).__mro__
+                if hasattr(sys.modules.get(cls.__module__), "WheelFile")
+            ),
+            None,
+        )
+        if module is None:  # pragma: no cover
+            return super().run()  # Files are added by ``build_meta`` afterwards
+
+        orig = module.WheelFile
+
+        class WheelFile(orig):
+            def write_files(self, base_dir):
+                super().write_files(base_dir)
+                for name, file in sorted(streamed.items()):
+                    self.write(file, name)
+                streamed.clear()
+
+        module.WheelFile = WheelFile
+        try:
+            return super().run()
+        finally:
+            module.WheelFile = orig
+
+
+class BytecodeMixin:
+    """Add the ``.pyc`` files produced by the ``bytecode`` option to the data files of
+    each package, so they do not need to be listed in ``package_data``
+    (``setuptools`` ignores the files in its own ``build`` directory, usually
+    ``dest``, that are listed by :func:`~setuptools_coconut.api.compiled_files`).
+    """
+
+    def find_data_files(self, package, src_dir):
+        files = list(super().find_data_files(package, src_dir))
+        generated = generated_files(build=False)  # e.g. nothing for ``sdist``
+        if not generated:
+            return files
+        cache_dir = join(src_dir, "__pycache__")
+        prefix = _norm(cache_dir) + "/"
+        found = {_norm(f) for f in files}
+        for file in sorted(generated):
+            name = file[len(prefix) :]
+            if file.startswith(prefix) and file.endswith(".pyc") and "/" not in name:
+                if file not in found:
+                    files.append(join(cache_dir, name))
+        return files
+
+
+def generated_files(build: bool = True) -> Set[str]:
+    """Normalised paths of all the files generated by the current build.
+    When ``build`` is ``False``, files are only returned if they were already
+    produced (see :func:`~setuptools_coconut.api.active_session`).
+    """
+    from .api import active_session, current_session
+
+    current = current_session() if build else active_session()
+    return set() if current is None else current.generated
+
+
+def _uses_bytecode() -> bool:
+    from .finder import CONFIG_FILE, discover_root, may_have_config
+
+    file = join(discover_root(), CONFIG_FILE)
+    if not may_have_config(file):
+        return False
+    from .config import CoconutConfig
+
+    config = CoconutConfig.from_file(file)
+    return config is not None and config.bytecode
+
+
+def _record(name: str, file: str):
+    streamed[name.replace(os.sep, "/")] = abspath(file)
+
+
+def _norm(path: str) -> str:
+    return abspath(path).replace(os.sep, "/")
@@ -0,0 +1,177 @@
+"""Incremental type checking of the generated files
+(see ``mypy_mode`` in :class:`~setuptools_coconut.config.CoconutConfig`).
+
+Instead of ``coconut --mypy`` (which starts from scratch in every build), ``mypy``
+is executed by the plugin, after compilation, either:
+
+- with a persistent cache directory (``"cache"``), kept in the state dir of the
+  project, so only the modules that changed (and their dependents) are rechecked;
+- via the ``mypy`` daemon (``"daemon"``), which keeps the entire program state in
+  memory between builds (the daemon is automatically restarted when the options
+  change, and shuts itself down after :obj:`DAEMON_TIMEOUT` seconds of inactivity).
+
+With ``mypy_background``, the type check runs concurrently with the rest of the
+build (:func:`start`) and its result is collected at the end (:func:`collect`).
+"""
+import atexit
+import os
+import sys
+from importlib.util import find_spec
+from os.path import abspath, basename, join
+from subprocess import DEVNULL, STDOUT, CalledProcessError, Popen
+from typing import Iterable, List, Optional, Tuple
+
+from . import debug
+from .config import MYPY_MODES, CoconutConfig  # noqa: F401 (re-export)
+from .engine import run_cmd
+
+DAEMON_TIMEOUT = 3600
+HEADER_FILE = "__coconut__.py"
+
+
+class Pending:
+    """Type check running in the background"""
+
+    def __init__(self, process: Popen, cmd: List[str], log: str):
+        self.process = process
+        self.cmd = cmd
+        self.log = log
+        self._output: Optional[str] = None
+
+    def wait(self) -> Tuple[int, str]:
+        """Return code and output (the log is read only once, before it is reused)"""
+        code = self.process.wait()
+        if self._output is None:
+            with open(self.log, "r", encoding="utf-8") as f:
+                self._output = f.read()
+        return code, self._output
+
+
+_pending: List[Pending] = []
+
+
+def mode(config: CoconutConfig) -> str:
+    """Mode effectively used (the daemon is replaced by the cache when ``dmypy``
+    is not available).
+    """
+    if config.mypy_mode == "daemon" and find_spec("mypy.dmypy") is None:
+        debug.print("dmypy not available, using mypy with a persistent cache instead")
+        return "cache"
+    return config.mypy_mode
+
+
+def mypy_args(project_root: str, config: CoconutConfig) -> List[str]:
+    """Equivalent to the arguments that ``coconut`` passes to ``mypy``"""
+    from coconut.compiler import Compiler
+    from coconut.compiler.util import get_target_info_smart
+
+    target = Compiler(target=config.target).target  # normalised
+    version = get_target_info_smart(target, mode="mypy")
+    state_dir = state_path(project_root, config)
+    return [
+        "--python-version",
+        ".".join(map(str, version)),
+        "--python-executable",
+        sys.executable,
+        "--pretty",
+        "--incremental",
+        "--cache-dir",
+        join(state_dir, "mypy"),
+    ]
+
+
+def state_path(project_root: str, config: CoconutConfig, *parts: str) -> str:
+    """The daemon outlives the build, so absolute paths are used"""
+    return abspath(join(project_root, config.state_dir(), *parts))
+
+
+def command(project_root: str, config: CoconutConfig, files: List[str]) -> List[str]:
+    args = [*mypy_args(project_root, config), *files]
+    if mode(config) == "daemon":
+        status = state_path(project_root, config, "dmypy.json")
+        dmypy = [sys.executable, "-m", "mypy.dmypy", "--status-file", status]
+        return [*dmypy, "run", "--timeout", str(DAEMON_TIMEOUT), "--", *args]
+    return [sys.executable, "-m", "mypy", *args]
+
+
+def run(project_root: str, config: CoconutConfig, outputs: Iterable[str]) -> str:
+    """Type check the generated ``outputs`` and return the output of ``mypy``,
+    raising :exc:`subprocess.CalledProcessError` when errors are found.
+    """
+    cmd = prepare(project_root, config, outputs)
+    if not cmd:
+        return ""
+    with debug.span("typecheck", mode=config.mypy_mode):
+        output = run_cmd(cmd)  # Errors are reported by run_cmd
+    debug.print(output)
+    return output
+
+
+def start(project_root: str, config: CoconutConfig, outputs: Iterable[str]):
+    """Similar to :func:`run`, but ``mypy`` runs in the background (writing to a
+    log file in the state dir). The result is obtained with :func:`collect`.
+    """
+    for check in _pending:
+        check.wait()  # At most one type check at a time (shared cache and log)
+    cmd = prepare(project_root, config, outputs)
+    if not cmd:
+        return
+    log = state_path(project_root, config, "typecheck.log")
+    with open(log, "w", encoding="utf-8") as f:
+        process = Popen(cmd, stdin=DEVNULL, stdout=f, stderr=STDOUT)
+    if not _pending:
+        atexit.register(_collect_at_exit)
+    _pending.append(Pending(process, cmd, log))
+    debug.print(f"Type check running in the background (log: {log!r})")
+
+
+def collect() -> List[str]:
+    """Wait for the type checks started by :func:`start` and return their outputs.
+    Errors are reported (and the first one is raised as
+    :exc:`subprocess.CalledProcessError`) after all the checks finish.
+    """
+    outputs: List[str] = []
+    errors: List[CalledProcessError] = []
+    while _pending:
+        check = _pending.pop(0)
+        with debug.span("typecheck_wait", log=check.log):
+            code, output = check.wait()
+        if code:
+            cmd = " ".join(check.cmd)
+            print(debug.format("Error for command", cmd, "\n", output))
+            errors.append(CalledProcessError(code, check.cmd, output))
+        else:
+            debug.print(output)
+        outputs.append(output)
+    if errors:
+        raise errors[0]
+    return outputs
+
+
+def prepare(
+    project_root: str, config: CoconutConfig, outputs: Iterable[str]
+) -> List[str]:
+    """Command for type checking the ``outputs`` (empty if there is nothing to do)"""
+    from coconut.command.util import set_mypy_path
+
+    set_mypy_path()  # Make coconut's stubs available (via MYPYPATH)
+    files = sorted(
+        f for f in outputs if f.endswith(".py") and basename(f) != HEADER_FILE
+    )
+    if not files:
+        return []
+    os.makedirs(state_path(project_root, config), exist_ok=True)
+    cmd = command(project_root, config, files)
+    debug.print(*cmd)
+    return cmd
+
+
+def _collect_at_exit():
+    """Type checks started in the background are not abandoned.
+    Failures are reported, but at this point they cannot change the exit code
+    (see :mod:`setuptools_coconut.build_meta`).
+    """
+    try:
+        collect()
+    except CalledProcessError:
+        pass
@@ -0,0 +1,356 @@
+"""Watch mode: recompile ``.coco`` files (and re-stage other files) as soon as they
+are modified.
+
+Start it from the project root with::
+
+    python -m setuptools_coconut watch
+
+On Linux, changes are detected via ``inotify``. Other platforms (or systems where
+``inotify`` is not available) use a polling strategy that only checks the
+modification time of the directories: the ones that changed (new, removed or
+renamed entries) are listed again, and the files inside of them are compared with
+the previous state. Editors usually save files by renaming a temporary file, which
+changes the directory. Files modified in place, without touching the directory,
+are only noticed by ``inotify``.
+"""
+import abc
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from fnmatch import translate
+from os.path import isdir, islink, join
+from re import compile as re_compile
+from subprocess import CalledProcessError
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import debug
+from .api import OtherFiles, compile_manifests
+from .config import CoconutConfig
+from .manifest import COCONUT_EXTENSIONS, coconut_files
+
+Ignore = Callable[[str], bool]
+
+# From linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT = struct.Struct("iIII")
+
+
+def ignore_patterns(patterns: Iterable[str]) -> Ignore:
+    """Names that should not be watched (hidden files/dirs are always ignored)"""
+    regex = re_compile("|".join(map(translate, (".*", *patterns))))
+    return lambda name: bool(regex.match(name))
+
+
+class Watcher(abc.ABC):
+    @abc.abstractmethod
+    def changes(self, timeout: float) -> Set[str]:
+        """Paths of the files that were modified, created or removed since the last
+        call (waits at most ``timeout`` seconds for changes to happen).
+        """
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, roots: Iterable[str], ignore: Ignore, interval: float = 0.5):
+        self.interval = interval
+        self._ignore = ignore
+        self._dirs: Dict[str, Tuple[int, Set[str]]] = {}
+        self._files: Dict[str, Tuple[int, int]] = {}
+        for root in roots:
+            self._add_dir(root)
+
+    def _add_dir(self, directory: str) -> Set[str]:
+        """Start watching ``directory`` and return all the files inside of it"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            names = {n for n in os.listdir(directory) if not self._ignore(n)}
+        except OSError:
+            return set()
+        self._dirs[directory] = (mtime, names)
+        found: Set[str] = set()
+        for name in names:
+            path = join(directory, name)
+            if isdir(path) and not islink(path):
+                found |= self._add_dir(path)
+            else:
+                self._files[path] = self._stat(path)
+                found.add(path)
+        return found
+
+    def _remove(self, path: str) -> Set[str]:
+        removed = {path} if self._files.pop(path, None) else set()
+        if path in self._dirs:
+            _, names = self._dirs.pop(path)
+            for name in names:
+                removed |= self._remove(join(path, name))
+        return removed
+
+    @staticmethod
+    def _stat(path: str) -> Tuple[int, int]:
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return (-1, -1)
+
+    def changes(self, timeout: float) -> Set[str]:
+        time.sleep(min(self.interval, timeout))
+        changed: Set[str] = set()
+        for directory, (mtime, names) in list(self._dirs.items()):
+            if directory not in self._dirs:
+                continue  # Removed while iterating
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                changed |= self._remove(directory)
+                continue
+            if current == mtime:
+                continue
+            new_names = {n for n in os.listdir(directory) if not self._ignore(n)}
+            self._dirs[directory] = (current, new_names)
+            for name in names - new_names:
+                changed |= self._remove(join(directory, name))
+            for name in new_names:
+                path = join(directory, name)
+                if name not in names and isdir(path) and not islink(path):
+                    changed |= self._add_dir(path)
+                elif path not in self._dirs:
+                    stat = self._stat(path)
+                    if self._files.get(path) != stat:
+                        self._files[path] = stat
+                        changed.add(path)
+        return changed
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, roots: Iterable[str], ignore: Ignore):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._ignore = ignore
+        self._roots = list(roots)
+        self._watches: Dict[int, str] = {}
+        self._files: Set[str] = set()
+        for root in self._roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, directory: str) -> Set[str]:
+        """Add watches for ``directory`` (recursively) and return the files inside
+        (which might have been created before the watch was in place).
+        """
+        path = os.fsencode(directory)
+        wd = self._libc.inotify_add_watch(self._fd, path, IN_MASK | IN_ONLYDIR)
+        if wd < 0:
+            return set()
+        self._watches[wd] = directory
+        found: Set[str] = set()
+        try:
+            with os.scandir(directory) as it:
+                entries = [e for e in it if not self._ignore(e.name)]
+        except OSError:
+            return found
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                found |= self._watch_tree(entry.path)
+            elif not entry.is_dir():
+                found.add(entry.path)
+        self._files |= found
+        return found
+
+    def _forget(self, directory: str) -> Set[str]:
+        """Stop watching ``directory`` (removed or moved away) and return the files
+        that were inside of it (no events are generated for them when it is moved).
+        """
+        prefix = directory + os.sep
+        for wd, path in list(self._watches.items()):
+            if path == directory or path.startswith(prefix):
+                del self._watches[wd]
+                self._libc.inotify_rm_watch(self._fd, wd)
+        removed = {f for f in self._files if f.startswith(prefix)}
+        self._files -= removed
+        return removed
+
+    def changes(self, timeout: float) -> Set[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:  # pragma: no cover
+            return set()
+
+        changed: Set[str] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            raw_name = data[offset + EVENT.size : offset + EVENT.size + length]
+            offset += EVENT.size + length
+            name = os.fsdecode(raw_name.rstrip(b"\0"))
+            if mask & IN_Q_OVERFLOW:  # pragma: no cover
+                debug.print("inotify queue overflow, re-scanning")
+                for root in self._roots:
+                    changed |= self._watch_tree(root)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not name or self._ignore(name):
+                continue
+            path = join(self._watches[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed |= self._watch_tree(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changed |= self._forget(path)
+            else:
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._files.discard(path)
+                else:
+                    self._files.add(path)
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(roots: List[str], ignore: Ignore, poll: bool = False) -> Watcher:
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots, ignore)
+        except (OSError, AttributeError) as ex:  # pragma: no cover
+            debug.print(f"inotify not available ({ex}), polling instead")
+    return PollingWatcher(roots, ignore)
+
+
+class Watch:
+    """Keeps the files in ``dest`` up to date with the ones in the ``src`` folders"""
+
+    def __init__(self, project_root: str, config: CoconutConfig, debounce=0.1):
+        self.root = project_root
+        self.config = config
+        self.debounce = debounce
+        self.paths = {
+            src: (join(project_root, src), join(project_root, dest))
+            for src, dest in config.build_paths().items()
+        }
+        self.sources = {s: set(coconut_files(r)) for s, (r, _) in self.paths.items()}
+        self.other_files = {
+            src: OtherFiles(
+                project_root, src, exclude=config.exclude, staging=config.staging
+            )
+            for src, (src_root, dest_root) in self.paths.items()
+            if src_root != dest_root
+        }
+
+    def relevant(self, changes: Iterable[str]) -> Set[str]:
+        """Filter changes that require the files in ``dest`` to be updated
+        (e.g. when compiling in-place, changes to the generated files are ignored).
+        """
+        result: Set[str] = set()
+        for src, (src_root, _) in self.paths.items():
+            prefix = src_root.rstrip(os.sep) + os.sep
+            other = self.other_files.get(src)
+            result.update(
+                f
+                for f in changes
+                if f.startswith(prefix)
+                and (f.endswith(COCONUT_EXTENSIONS) or other and not other.excluded(f))
+            )
+        return result
+
+    def build(self, changes: Optional[Set[str]] = None):
+        """Compile the modified ``.coco`` files and stage the other files.
+        When ``changes`` is not given, all the files are considered.
+        """
+        coconut = changes is None
+        for src, (src_root, dest_root) in self.paths.items():
+            prefix = src_root.rstrip(os.sep) + os.sep
+            changed = {f for f in changes or () if f.startswith(prefix)}
+            for file in changed:
+                if not file.endswith(COCONUT_EXTENSIONS):
+                    continue
+                coconut = True
+                if os.path.isfile(file):
+                    self.sources[src].add(file)
+                else:
+                    self.sources[src].discard(file)
+            other = self.other_files.get(src)
+            if other and changes is None:
+                list(other.link_or_copy(dest_root))
+            elif other and changed:
+                other.sync(dest_root, changed)
+
+        if coconut:
+            try:
+                compile_manifests(self.root, self.config, self.sources)
+            except CalledProcessError:
+                pass  # Already reported, wait for the next change
+            except OSError as ex:
+                # e.g. files removed while compiling, wait for the next change
+                print(debug.format(f"Build failed: {ex}"), file=sys.stderr, flush=True)
+
+    def ignore(self) -> Ignore:
+        return ignore_patterns(self.config.exclude)
+
+    def wait(self, watcher: Watcher) -> Set[str]:
+        """Block until files change, then collect changes until things settle"""
+        changes: Set[str] = set()
+        while not changes:
+            changes = self.relevant(watcher.changes(timeout=1))
+        while True:
+            more = self.relevant(watcher.changes(timeout=self.debounce))
+            if not more:
+                return changes
+            changes |= more
+
+    def run(self, poll: bool = False):
+        roots = [src_root for src_root, _ in self.paths.values()]
+        print(debug.format("Building..."), flush=True)
+        self.build()
+        with create_watcher(roots, self.ignore(), poll) as watcher:
+            print(debug.format("Watching", *roots, "(Ctrl+C to stop)"), flush=True)
+            try:
+                while True:
+                    changes = self.wait(watcher)
+                    print(debug.format(f"{len(changes)} file(s) changed"), flush=True)
+                    self.build(changes)
+            except KeyboardInterrupt:
+                pass
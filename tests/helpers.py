@@ -14,6 +14,12 @@ from setuptools import build_meta as setuptools
 from setuptools_coconut.api import run_cmd
 
 
+def mkfile(path: Path, contents: str = "") -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+    return str(path)
+
+
 def rmpath(path):
     try:
         rmtree(str(path), onerror=set_writable)
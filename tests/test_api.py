@@ -3,7 +3,9 @@ from textwrap import dedent
 
 import pytest
 
-from setuptools_coconut import api
+from setuptools_coconut import api, finder, stream
+from setuptools_coconut.config import LAZY_ENV_VAR, CoconutConfig
+from setuptools_coconut.manifest import Manifest
 
 
 def mkpath(path: Path):
@@ -29,6 +31,23 @@ def mksrc(parent):
     return [mkpath(p) for p in paths]
 
 
+class TestDiscoverRoot:
+    def test_discover_root(self, tmp_path, monkeypatch):
+        nested = tmp_path / "a/b/c"
+        nested.mkdir(parents=True)
+        (tmp_path / "a/setup.cfg").touch()
+        assert api.discover_root(str(nested)) == str(tmp_path / "a")
+
+        monkeypatch.chdir(nested)
+        assert api.discover_root() == str(tmp_path / "a")
+        assert finder._discover_root.cache_info().hits >= 1
+
+    def test_no_markers(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(finder, "PROJECT_MARKERS", ("non-existing-marker",))
+        finder._discover_root.cache_clear()
+        assert api.discover_root(str(tmp_path)) == str(tmp_path)
+
+
 class TestOtherFiles:
     def test_find_files(self, tmp_path):
         mksrc(tmp_path)
@@ -66,6 +85,210 @@ class TestOtherFiles:
             assert f.exists()
             assert f.read_text() == repr(str(f)).replace("build", "src")
 
+    def test_exclude(self, tmp_path):
+        mksrc(tmp_path)
+        src = Path(tmp_path, "src")
+        mkpath(src / "pkg/__pycache__/module1.cpython-39.pyc")
+        mkpath(src / "pkg.egg-info/PKG-INFO")
+        mkpath(src / "pkg/subpkg1/notes.tmp")
+        other = api.OtherFiles(str(tmp_path), "src", exclude=api.DEFAULT_EXCLUDE)
+        assert len(other.files) == 4
+        assert str(src / "pkg/subpkg1/notes.tmp") in other.files
+
+        exclude = (*api.DEFAULT_EXCLUDE, "*.tmp", "pkg/subpkg2")
+        other = api.OtherFiles(str(tmp_path), "src", exclude=exclude)
+        assert other.files == [str(src / "pkg/subpkg1/data.txt")]
+
+    def test_incremental(self, tmp_path, monkeypatch):
+        mksrc(tmp_path)
+        build = Path(tmp_path, "build")
+        (build / "pkg/subpkg2").mkdir(parents=True)
+        stale = mkpath(build / "pkg/subpkg2/pymodule.py")  # e.g. from a previous copy
+        list(api.OtherFiles(str(tmp_path), "src").link_or_copy(str(build)))
+        assert stale.is_symlink()
+
+        def fail(*_):
+            raise AssertionError("files in sync should not be touched")
+
+        monkeypatch.setattr(api.os, "symlink", fail)
+        monkeypatch.setattr(api.os, "unlink", fail)
+        files = list(api.OtherFiles(str(tmp_path), "src").link_or_copy(str(build)))
+        assert len(files) == 3
+
+
+class TestCompile:
+    @pytest.mark.parametrize("batch, calls", [(True, 1), (False, 2)])
+    def test_batch(self, tmp_path, monkeypatch, batch, calls):
+        for src in ("src1", "src2"):
+            mkpath(tmp_path / src / "pkg/__init__.coco")
+        recorded = []
+        monkeypatch.setitem(api.ENGINES, "subprocess", recorded.append)
+
+        config = CoconutConfig(src=("src1", "src2"), dest="build", batch=batch)
+        assert len(list(api.compile(str(tmp_path), config))) == 2
+        assert len(recorded) == calls
+        args = [a for cmd in recorded for a in cmd]
+        for src in ("src1", "src2"):
+            assert str(tmp_path / src) in args
+            assert str(tmp_path / "build" / src) in args
+        assert ("--and" in args) is batch
+
+
+class TestSession:
+    def test_files_under(self, tmp_path, monkeypatch):
+        mksrc(tmp_path)
+        build = tmp_path / "build/src"
+        manifest = Manifest("manifest.json", str(tmp_path / "src"), str(build), {})
+        manifest.entries = {
+            "pkg/__init__.coco": {"outputs": ["pkg/__init__.py"]},
+            "pkg/subpkg1/__init__.coco": {"outputs": ["pkg/subpkg1/__init__.py"]},
+        }
+        calls = []
+
+        def fake_compile(root, _config):
+            calls.append(root)
+            return [manifest]
+
+        monkeypatch.setattr(api, "compile_manifests", fake_compile)
+        session = api.Session(str(tmp_path), CoconutConfig(dest="build"))
+
+        def files_under(path):
+            return sorted(session.files_under(str(path)))
+
+        assert files_under(build / "pkg/subpkg1") == [
+            str(build / "pkg/subpkg1/__init__.py"),
+            str(build / "pkg/subpkg1/data.txt"),
+        ]
+        assert files_under(build / "pkg/subpkg") == []
+        assert len(files_under(tmp_path)) == 5  # 2 compiled + 3 other files
+        assert calls == [str(tmp_path)]
+
+    def test_compiled_files_once(self, pyproject, monkeypatch):
+        pyproject.write_text('[tool.coconut]\ndest = "build"')
+        project_path = pyproject.parent
+        mksrc(project_path)
+        calls = []
+
+        def fake_compile(*args):
+            calls.append(args)
+            return []
+
+        monkeypatch.setattr(api, "compile_manifests", fake_compile)
+        monkeypatch.chdir(project_path)
+        api.session.cache_clear()
+
+        assert sorted(api.compiled_files("build/src/pkg/subpkg2")) == [
+            "__init__.py",
+            "pymodule.py",
+        ]
+        assert list(api.compiled_files("build/src/pkg/subpkg1")) == ["data.txt"]
+        assert len(calls) == 1
+
+        # A new build (e.g. in the same long-lived process) starts from scratch
+        (project_path / "src/pkg/subpkg2/new.py").write_text("")
+        finder.start_build(None)
+        assert "new.py" in api.compiled_files("build/src/pkg/subpkg2")
+        assert len(calls) == 2
+
+    def test_session_shared_with_stream(self, pyproject, monkeypatch):
+        pyproject.write_text('[tool.coconut]\ndest = "build"')
+        mksrc(pyproject.parent)
+        calls = []
+
+        def fake_compile(*args):
+            calls.append(args)
+            return []
+
+        monkeypatch.setattr(api, "compile_manifests", fake_compile)
+        monkeypatch.chdir(pyproject.parent)
+        finder.start_build(None)
+
+        assert list(api.compiled_files("build/src/pkg/subpkg1")) == ["data.txt"]
+        assert stream.generated_files() == set()
+        assert len(calls) == 1
+
+        # Lazy builds (e.g. editable) never compile the modules
+        monkeypatch.setenv(LAZY_ENV_VAR, "1")
+        finder.start_build(None)
+        assert list(api.compiled_files("build/src/pkg/subpkg1")) == ["data.txt"]
+        assert stream.generated_files() == set()
+        assert len(calls) == 1
+
+    def test_bytecode_mixin(self, pyproject, monkeypatch):
+        from setuptools import Distribution
+
+        mksrc(pyproject.parent)
+        calls = []
+
+        def fake_compile(*args):
+            calls.append(args)
+            return []
+
+        monkeypatch.setattr(api, "compile_manifests", fake_compile)
+        monkeypatch.chdir(pyproject.parent)
+
+        pyproject.write_text('[tool.coconut]\ndest = "build"')
+        dist = Distribution()
+        stream.finalize_distribution_options(dist)
+        assert "build_py" not in dist.cmdclass
+
+        pyproject.write_text('[tool.coconut]\ndest = "build"\nbytecode = true')
+        dist = Distribution()
+        stream.finalize_distribution_options(dist)
+        assert issubclass(dist.cmdclass["build_py"], stream.BytecodeMixin)
+
+        class BuildPy:
+            def find_data_files(self, package, src_dir):
+                return ["data.txt"]
+
+        class Command(stream.BytecodeMixin, BuildPy):
+            pass
+
+        # No files are compiled for builds that do not use them (e.g. sdist)
+        finder.start_build(dist)
+        assert Command().find_data_files("pkg", "src/pkg") == ["data.txt"]
+        assert calls == []
+        list(api.compiled_files("build/src/pkg"))
+        assert Command().find_data_files("pkg", "src/pkg") == ["data.txt"]
+        assert len(calls) == 1
+
+
+def test_overrides(tmp_path):
+    pkg = tmp_path / "src/pkg"
+    pkg.mkdir(parents=True)
+    (pkg / "__init__.coco").write_text("")
+    recursive = "def count(n, acc=0) = count(n - 1, acc + 1) if n else acc\n"
+    (pkg / "parser.coco").write_text(recursive)
+    (pkg / "numeric.coco").write_text(recursive)
+    options = dict(src=["src"], engine="inprocess")
+    expected = CoconutConfig(**options, dest="expected")
+    api.compile(str(tmp_path), expected)
+
+    overrides = [{"paths": ["src/pkg/numeric.coco"], "tco": False, "target": "3.8"}]
+    config = CoconutConfig(**options, dest="build", overrides=overrides)
+    groups = api.group_by_options(
+        str(tmp_path), config, [(str(f), "") for f in sorted(pkg.glob("*.coco"))]
+    )
+    assert len(groups) == 2
+    no_tco = tuple(config.for_file("src/pkg/numeric.coco").as_cli_args())
+    assert "--no-tco" in no_tco
+    assert [Path(f).name for f, _ in groups[no_tco]] == ["numeric.coco"]
+
+    api.compile(str(tmp_path), config)
+    out = tmp_path / "build/src/pkg"
+    assert "_coconut_tail_call" in (out / "parser.py").read_text()
+    assert "_coconut_tail_call" not in (out / "numeric.py").read_text()
+    # The header corresponds to the project-wide options
+    header = (tmp_path / "expected/src/pkg/__coconut__.py").read_text()
+    assert (out / "__coconut__.py").read_text() == header
+
+    # Changing the overrides invalidates the previous build
+    mtime = (out / "parser.py").stat().st_mtime_ns
+    api.compile(str(tmp_path), config)
+    assert (out / "parser.py").stat().st_mtime_ns == mtime
+    api.compile(str(tmp_path), CoconutConfig(**options, dest="build"))
+    assert "_coconut_tail_call" in (out / "numeric.py").read_text()
+
 
 class CompileFiles:
     def test_default_src_target(self, pyproject):
@@ -0,0 +1,69 @@
+from benchmarks import build, imports, results
+from benchmarks.project import ProjectSpec, generate, touch_module
+from setuptools_coconut import api
+from setuptools_coconut.config import CoconutConfig
+
+
+def test_generate(tmp_path):
+    spec = ProjectSpec(modules=5, functions=2, depth=3, data_files=4, roots=2)
+    root = generate(tmp_path, spec, {"engine": "inprocess", "cache": True})
+    config = CoconutConfig.from_file(root / "pyproject.toml")
+    assert config.src == ("src", "src1")
+    assert config.engine == "inprocess" and config.cache
+
+    for src in spec.src():
+        assert len(list((root / src).glob("**/mod*.coco"))) == 5
+        assert len(list((root / src).glob("**/__init__.coco"))) == 3
+        assert len(list((root / src).glob("**/data*.bin"))) == 4
+    assert (root / "src/pkg/sub0/sub1/__init__.coco").exists()
+
+    before = (root / "src/pkg/mod0.coco").read_text()
+    touch_module(root, spec)
+    assert (root / "src/pkg/mod0.coco").read_text() != before
+
+
+def test_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "compile_manifests", lambda *_: [])
+    out = tmp_path / "results.json"
+    build.main(["--modules", "2", "--repeat", "2", "--dir", str(tmp_path / "proj")])
+    build.main(["--modules", "2", "--repeat", "1", "--output", str(out)])
+
+    contents = results.load(out)
+    assert contents["params"]["spec"]["modules"] == 2
+    assert len(contents["results"]["cold_build"]["runs"]) == 1
+    assert "staging_warm" in results.table(contents, contents)
+    assert len(list((tmp_path / "proj/staging/src").glob("**/data*.bin"))) == 50
+
+
+def test_imports(tmp_path):
+    out = tmp_path / "results.json"
+    argv = ["--modules", "2", "--depth", "1", "--data-files", "1", "--repeat", "1"]
+    options = ["--engine", "inprocess", "--bytecode", "--no-tco"]
+    imports.main(
+        [*argv, *options, "--dir", str(tmp_path / "proj"), "--output", str(out)]
+    )
+
+    contents = results.load(out)
+    assert contents["params"]["options"]["tco"] is False
+    assert set(contents["results"]) == {
+        "import_all",
+        "import:pkg",
+        "import:pkg.mod0",
+        "import:pkg.mod1",
+    }
+    mod0 = contents["results"]["import:pkg.mod0"]
+    assert 0 < mod0["self_us"] <= mod0["cumulative_us"]
+    site = tmp_path / "proj/site-packages"
+    assert list(site.glob("pkg/__pycache__/mod0.*.pyc"))
+
+
+def test_parse_importtime():
+    output = """\
+import time: self [us] | cumulative | imported package
+import time:       210 |        210 |   pkg.__coconut__
+import time:        95 |        305 | pkg
+"""
+    assert imports.parse_importtime(output) == {
+        "pkg.__coconut__": {"self": 210, "cumulative": 210},
+        "pkg": {"self": 95, "cumulative": 305},
+    }
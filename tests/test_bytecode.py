@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from setuptools_coconut import bytecode
+
+
+def import_module(directory, name):
+    cmd = [sys.executable, "-c", f"import {name}"]
+    env = {**os.environ, "PYTHONPATH": str(directory)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.run(cmd, env=env, check=True)
+
+
+@pytest.mark.parametrize("mode", ["checked-hash", "unchecked-hash", "timestamp"])
+def test_compile_files(tmp_path, mode):
+    files = [tmp_path / f"mod{i}.py" for i in range(4)]
+    for i, file in enumerate(files):
+        file.write_text(f"x = {i}\n")
+    (tmp_path / "data.txt").write_text("not python")
+    sources = [str(f) for f in files] + [str(tmp_path / "data.txt")]
+
+    pycs = bytecode.compile_files(sources, (0, 1), mode, workers=2)
+    assert len(pycs) == 8
+    assert all(os.path.exists(p) for p in pycs)
+    assert bytecode.cache_file(sources[0], 1).endswith(".opt-1.pyc")
+    mtimes = {p: os.stat(p).st_mtime_ns for p in pycs}
+
+    # Up to date files are not rewritten (neither when compiling nor importing)
+    assert bytecode.compile_files(sources, (0, 1), mode, workers=1) == pycs
+    import_module(tmp_path, "mod0")
+    assert {p: os.stat(p).st_mtime_ns for p in pycs} == mtimes
+
+    files[0].write_text("x = 42\n")
+    pyc = bytecode.cache_file(str(files[0]))
+    assert not bytecode.up_to_date(str(files[0]), pyc, mode)
+    bytecode.compile_files(sources[:1], workers=1, invalidation_mode=mode)
+    assert bytecode.up_to_date(str(files[0]), pyc, mode)
+
+
+def test_hash_based_pycs_survive_installation(tmp_path):
+    source = tmp_path / "mod.py"
+    source.write_text("x = 1\n")
+    (pyc,) = bytecode.compile_files([str(source)])
+    mtime = os.stat(pyc).st_mtime_ns
+
+    # Installers do not preserve modification times
+    os.utime(source, ns=(0, 10**18))
+    assert bytecode.up_to_date(str(source), pyc, "checked-hash")
+    import_module(tmp_path, "mod")
+    assert os.stat(pyc).st_mtime_ns == mtime
@@ -0,0 +1,94 @@
+import os
+
+from setuptools_coconut import api
+from setuptools_coconut.cache import HEADER_FILE, CompileCache, package_level
+from setuptools_coconut.config import CACHE_ENV_VAR, CoconutConfig
+from setuptools_coconut.manifest import signature
+
+from .helpers import mkfile
+
+
+def test_package_level(tmp_path):
+    assert package_level(mkfile(tmp_path / "mod.coco")) == 0
+    mkfile(tmp_path / "pkg/__init__.coco")
+    assert package_level(mkfile(tmp_path / "pkg/mod.coco")) == 0
+    mkfile(tmp_path / "pkg/sub/__init__.coco")
+    assert package_level(mkfile(tmp_path / "pkg/sub/mod.coco")) == 1
+
+
+def test_store_and_restore(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"), 2**20)
+    sig = signature(["--target", "3.6"])
+    src = mkfile(tmp_path / "project1/src/mod.coco", "x = 1")
+    out = mkfile(tmp_path / "project1/build/mod.py", "compiled")
+    mkfile(tmp_path / "project1/build" / HEADER_FILE, "header")
+    cache.store(sig, src, out)
+
+    # Same contents in a different project
+    other = mkfile(tmp_path / "project2/src/mod.coco", "x = 1")
+    other_out = tmp_path / "project2/build/mod.py"
+    assert cache.restore(sig, other, str(other_out))
+    assert other_out.read_text() == "compiled"
+    assert (other_out.parent / HEADER_FILE).read_text() == "header"
+
+    # Different contents or arguments
+    assert not cache.restore(signature(["--target", "3.8"]), other, str(other_out))
+    mkfile(tmp_path / "project2/src/mod.coco", "x = 2")
+    assert not cache.restore(sig, other, str(other_out))
+
+
+def test_header_for_new_options(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"), 2**20)
+    src = mkfile(tmp_path / "src/mod.coco", "x = 1")
+    out = tmp_path / "build/mod.py"
+    header = tmp_path / "build" / HEADER_FILE
+    for target in ("3.6", "3.8"):
+        mkfile(out, f"compiled {target}")
+        mkfile(header, f"header {target}")
+        cache.store(signature(["--target", target]), src, str(out))
+
+    # Switching options with a warm cache (every file is stale and restored)
+    cache = CompileCache(str(tmp_path / "cache"), 2**20)
+    assert cache.restore(signature(["--target", "3.6"]), src, str(out))
+    assert out.read_text() == "compiled 3.6"
+    assert header.read_text() == "header 3.6"
+
+
+def test_switch_target(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_ENV_VAR, str(tmp_path / "cache"))
+    mkfile(tmp_path / "src/pkg/__init__.coco")
+    mkfile(tmp_path / "src/pkg/mod.coco", "x = 1 |> (+)$(1)\n")
+    header = tmp_path / "build/src/pkg" / HEADER_FILE
+    options = dict(src=["src"], dest="build", cache=True, engine="inprocess")
+    headers = {}
+    for target in ("3.6", "3.8"):
+        api.compile(str(tmp_path), CoconutConfig(**options, target=target))
+        headers[target] = header.read_text()
+    assert headers["3.6"] != headers["3.8"]
+
+    # Every file is restored from the (warm) cache
+    monkeypatch.setattr(api, "ENGINES", {"inprocess": None})
+    api.compile(str(tmp_path), CoconutConfig(**options, target="3.6"))
+    assert header.read_text() == headers["3.6"]
+
+
+def test_evict(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"), 25)
+    sig = signature([])
+    mkfile(tmp_path / "build" / HEADER_FILE)
+    files = []
+    for i in range(3):
+        src = mkfile(tmp_path / f"src/mod{i}.coco", f"x = {i}")
+        out = mkfile(tmp_path / f"build/mod{i}.py", "0123456789")
+        cache.store(sig, src, out)
+        files.append((src, out))
+
+    for i, (src, _) in enumerate(files):
+        os.utime(cache._path(cache.file_key(sig, src)), (i, i))
+    # Accessing an entry makes it "recently used"
+    assert cache.restore(sig, *files[0])
+
+    cache.evict()
+    assert len(list(cache._entries())) == 3  # 2 files + header
+    assert cache.restore(sig, *files[0])
+    assert not cache.restore(sig, *files[1])
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from textwrap import dedent
 
@@ -82,6 +83,87 @@ def test_invalid_config(pyproject):
     assert "extra fields not permitted" in msg
 
 
+def test_invalid_engine(pyproject):
+    example = """\
+    [tool.coconut]
+    engine = "asdf"
+    """
+    pyproject.write_text(dedent(example))
+    with pytest.raises(ValueError) as exc:
+        CoconutConfig.from_file(pyproject)
+    msg = str(exc.value).replace("`", "")
+    assert "engine should be one of" in msg
+
+
+def test_invalid_staging(pyproject):
+    example = """\
+    [tool.coconut]
+    staging = "teleport"
+    """
+    pyproject.write_text(dedent(example))
+    with pytest.raises(ValueError) as exc:
+        CoconutConfig.from_file(pyproject)
+    msg = str(exc.value).replace("`", "")
+    assert "staging should be one of" in msg
+
+
+def test_invalid_bytecode_options(pyproject, monkeypatch):
+    pyproject.write_text("[tool.coconut]\noptimize = [0, 3]\n")
+    with pytest.raises(ValueError) as exc:
+        CoconutConfig.from_file(pyproject)
+    assert "optimize levels should be in" in str(exc.value).replace("`", "")
+
+    pyproject.write_text('[tool.coconut]\ninvalidation_mode = "never"\n')
+    with pytest.raises(ValueError) as exc:
+        CoconutConfig.from_file(pyproject)
+    msg = str(exc.value).replace("`", "")
+    assert "invalidation_mode should be one of" in msg
+
+    assert CoconutConfig(bytecode=True).bytecode
+    with monkeypatch.context() as m:
+        m.setattr(sys, "version_info", (3, 6, 15, "final", 0))
+        with pytest.raises(ValueError) as exc:
+            CoconutConfig(bytecode=True)
+    assert "bytecode requires Python 3.7" in str(exc.value).replace("`", "")
+
+
+def test_overrides(pyproject):
+    example = """\
+    [tool.coconut]
+    target = "3.8"
+
+    [[tool.coconut.overrides]]
+    paths = ["src/pkg/numeric/*", "src/pkg/fast.coco"]
+    tco = false
+
+    [[tool.coconut.overrides]]
+    paths = ["src/pkg/numeric/legacy.coco"]
+    target = "3.6"
+    """
+    pyproject.write_text(dedent(example))
+    cfg = CoconutConfig.from_file(pyproject)
+    assert cfg.for_file("src/pkg/parser.coco") is cfg
+    assert cfg.for_file(os.path.join("src", "pkg", "fast.coco")).tco is False
+    legacy = cfg.for_file("src/pkg/numeric/legacy.coco")
+    assert (legacy.tco, legacy.target, legacy.strict) == (False, "3.6", True)
+    assert "--no-tco" in cfg.for_file("src/pkg/numeric/linalg.coco").as_cli_args()
+    assert cfg.overrides[1].compiler_options() == {"target": "3.6"}
+
+    pyproject.write_text('[[tool.coconut.overrides]]\npaths = ["*"]\nfoo = 1\n')
+    with pytest.raises(ValueError):
+        CoconutConfig.from_file(pyproject)
+
+
+def test_snapshot(pyproject):
+    pyproject.write_text('[tool.coconut]\ntarget = "3.8"\n')
+    cfg = CoconutConfig.from_file(pyproject)
+    assert CoconutConfig.from_file(pyproject) is cfg
+    assert CoconutConfig.from_file(str(pyproject)) is cfg
+
+    pyproject.write_text('[tool.coconut]\ntarget = "3.10"\n')
+    assert CoconutConfig.from_file(pyproject).target == "3.10"
+
+
 def test_non_existing_file(tmp_path, capsys, monkeypatch):
     monkeypatch.setattr(debug, "DEBUG", True)
     pyproject = Path(tmp_path, "no-file")
@@ -0,0 +1,85 @@
+import json
+import threading
+
+import pytest
+
+from setuptools_coconut import api, debug
+from setuptools_coconut.config import CoconutConfig
+
+from .test_api import mksrc
+
+
+@pytest.fixture
+def trace(tmp_path, monkeypatch):
+    def _trace(name):
+        file = tmp_path / name
+        monkeypatch.setattr(debug, "TRACE", str(file))
+        return file
+
+    yield _trace
+    debug._close_trace()
+
+
+def test_span_disabled(monkeypatch):
+    monkeypatch.setattr(debug, "TRACE", None)
+    with debug.span("phase", a=1) as attrs:
+        attrs["b"] = 2
+    assert attrs == {"a": 1, "b": 2}
+
+
+def test_json_lines(trace):
+    file = trace("trace.jsonl")
+    with debug.span("outer", src="src", start="/tmp") as attrs:
+        with debug.span("inner"):
+            pass
+        attrs["files"] = 3
+    with pytest.raises(ValueError):
+        with debug.span("failed"):
+            raise ValueError()
+
+    events = [json.loads(line) for line in file.read_text().splitlines()]
+    assert [e["name"] for e in events] == ["inner", "outer", "failed"]
+    inner, outer, _ = events
+    assert outer["args"] == {"src": "src", "start": "/tmp", "files": 3}
+    assert isinstance(outer["start"], float)  # Not replaced by the attributes
+    assert outer["start"] <= inner["start"]
+    assert outer["duration"] >= inner["duration"] >= 0
+
+
+def test_chrome_trace(trace):
+    file = trace("trace.json")
+
+    def work():
+        with debug.span("thread"):
+            pass
+
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    with debug.span("build", engine="inprocess"):
+        with debug.span("stage", file="data.txt"):
+            pass
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    text = file.read_text()
+    assert text.startswith("[\n") and text.endswith(",\n")
+    events = json.loads(text.rstrip(",\n") + "]")
+    assert [e["name"] for e in events] == ["stage", "build", "thread", "thread"]
+    assert events[0]["tid"] not in {e["tid"] for e in events[2:]}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert events[1]["args"] == {"engine": "inprocess"}
+
+
+def test_build_spans(tmp_path, trace, monkeypatch):
+    file = trace("trace.jsonl")
+    mksrc(tmp_path)
+    monkeypatch.setattr(api, "compile_manifests", lambda *_: [])
+    session = api.Session(str(tmp_path), CoconutConfig(dest="build"))
+    assert len(session.index) == 3
+
+    events = [json.loads(line) for line in file.read_text().splitlines()]
+    names = [e["name"] for e in events]
+    assert names.count("stage") == 3
+    assert names[-1] == "other_files"
+    assert {e["args"]["action"] for e in events if e["name"] == "stage"} == {"symlink"}
@@ -0,0 +1,111 @@
+import json
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+from setuptools_coconut import build_meta, editable
+from setuptools_coconut.api import Session
+from setuptools_coconut.config import CoconutConfig
+
+from .test_api import mksrc
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {editable!r})
+import editable
+editable.install(json.loads({config!r}))
+import pkg.subpkg1
+print(pkg.subpkg1.__file__)
+"""
+
+
+def import_lazily(tmp_path, config):
+    finder_config = build_meta.finder_config(str(tmp_path), config)
+    script = SCRIPT.format(
+        editable=str(Path(editable.__file__).parent),
+        config=json.dumps(finder_config),
+    )
+    cmd = [sys.executable, "-c", f"import json\n{script}"]
+    out = subprocess.run(cmd, cwd=str(tmp_path), capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip()
+
+
+def test_lazy_compilation(tmp_path):
+    for file in mksrc(tmp_path):
+        file.write_text(file.read_text() + "\n")
+    (tmp_path / "src/pkg/subpkg1/__init__.coconut").write_text("x = 1 |> (+)$(1)\n")
+    config = CoconutConfig(src=["src"], dest="build")
+    dest = tmp_path / "build/src/pkg"
+
+    output = import_lazily(tmp_path, config)
+    assert Path(output) == dest / "subpkg1/__init__.py"
+    assert (dest / "__init__.py").exists()
+    assert (dest / "__coconut__.py").exists()
+    assert not (dest / "module1.py").exists()  # Never imported
+
+    mtime = (dest / "subpkg1/__init__.py").stat().st_mtime_ns
+    import_lazily(tmp_path, config)
+    assert (dest / "subpkg1/__init__.py").stat().st_mtime_ns == mtime
+
+    # Recompiled with the new options (even if the source is not modified)
+    code = (dest / "subpkg1/__init__.py").read_text()
+    import_lazily(tmp_path, config.copy(update={"target": "3.8"}))
+    assert (dest / "subpkg1/__init__.py").read_text() != code
+    signatures = json.loads(
+        (tmp_path / "build/.setuptools-coconut/editable.json").read_text()
+    )
+    assert str(dest / "subpkg1/__init__.py") in signatures
+
+
+def test_add_files(tmp_path):
+    wheel = tmp_path / "pkg-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, "w") as z:
+        z.writestr("pkg.pth", "/src\n")
+        z.writestr(
+            "pkg-1.0.dist-info/RECORD", "pkg.pth,,\npkg-1.0.dist-info/RECORD,,\n"
+        )
+
+    build_meta.add_files(str(wheel), {"extra.py": "x = 1\n"})
+    with zipfile.ZipFile(wheel) as z:
+        assert sorted(z.namelist()) == [
+            "extra.py",
+            "pkg-1.0.dist-info/RECORD",
+            "pkg.pth",
+        ]
+        record = z.read("pkg-1.0.dist-info/RECORD").decode().splitlines()
+        assert record[0] == "pkg.pth,,"
+        assert record[1].startswith("extra.py,sha256=")
+        assert record[1].endswith(",6")
+        assert record[-1] == "pkg-1.0.dist-info/RECORD,,"
+
+    build_meta.add_files(str(wheel), {"extra.py": b"x = 22\n"})  # Replaced
+    with zipfile.ZipFile(wheel) as z:
+        assert z.namelist().count("extra.py") == 1
+        assert z.read("extra.py") == b"x = 22\n"
+        record = z.read("pkg-1.0.dist-info/RECORD").decode().splitlines()
+        assert [r for r in record if r.startswith("extra.py,")][0].endswith(",7")
+
+
+def test_lazy_session(tmp_path):
+    files = mksrc(tmp_path)
+    config = CoconutConfig(src=["src"], dest="build")
+    outputs = Session(str(tmp_path), config, lazy=True).files_under(str(tmp_path))
+    outputs = {Path(f).relative_to(tmp_path).as_posix() for f in outputs}
+    assert "build/src/pkg/subpkg1/data.txt" in outputs
+    assert not any(f.endswith(".py") and "subpkg2" not in f for f in outputs)
+    assert not (tmp_path / "build/src/pkg/module1.py").exists()
+    assert files[0].exists()
+
+
+def test_overrides(tmp_path):
+    overrides = [{"paths": ["src/pkg/fast.coco"], "tco": False, "target": "3.8"}]
+    config = CoconutConfig(src=["src"], dest="build", overrides=overrides)
+    finder_config = json.loads(
+        json.dumps(build_meta.finder_config(str(tmp_path), config))
+    )
+    finder = editable.CoconutFinder(**finder_config)
+    fast = finder.options_for(str(tmp_path / "src/pkg/fast.coco"))
+    assert fast == {**finder.options, "no_tco": True, "target": "3.8"}
+    assert finder.options_for(str(tmp_path / "src/pkg/slow.coco")) == finder.options
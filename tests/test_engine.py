@@ -0,0 +1,62 @@
+import os
+import sys
+from pathlib import Path
+from subprocess import CalledProcessError
+
+import pytest
+
+from setuptools_coconut.engine import ENGINES, run_inprocess
+
+OPTS = ["--target", "3.6", "-j", "0", "--strict", "--quiet"]
+
+
+def compile_with(engine, tmp_path: Path, code: str) -> Path:
+    src = tmp_path / engine / "src"
+    dest = tmp_path / engine / "build"
+    src.mkdir(parents=True)
+    (src / "__init__.coco").write_text("")
+    (src / "mod.coco").write_text(code)
+    ENGINES[engine]([str(src), str(dest), *OPTS])
+    return dest
+
+
+def test_same_output(tmp_path):
+    code = "def square(x) = x ** 2\n"
+    outputs = {}
+    for engine in ENGINES:
+        dest = compile_with(engine, tmp_path, code)
+        outputs[engine] = {
+            str(p.relative_to(dest)): p.read_text() for p in dest.glob("**/*.py")
+        }
+    first, *others = outputs.values()
+    assert first
+    for other in others:
+        assert other == first
+
+
+@pytest.mark.parametrize("engine", list(ENGINES))
+def test_error(engine, tmp_path):
+    with pytest.raises(CalledProcessError) as exc:
+        compile_with(engine, tmp_path, "def square(x) = )\n")
+    assert exc.value.returncode != 0
+    assert "CoconutSyntaxError" in exc.value.output
+
+
+def test_inprocess_isolation(tmp_path, monkeypatch):
+    from coconut.terminal import logger
+
+    # Piped input is neither executed nor read (a pipe that is never closed)
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"raise SystemExit(3)\n")
+    with open(read_fd, "r") as stdin:
+        monkeypatch.setattr(sys, "stdin", stdin)
+        limit = sys.getrecursionlimit()
+        compile_with("inprocess", tmp_path, "x = 1\n")
+        assert sys.stdin is stdin
+    os.close(write_fd)
+
+    # Global state changed by the command line arguments is restored
+    assert logger.quiet is False
+    src = tmp_path / "inprocess/src"
+    run_inprocess([str(src), str(tmp_path / "out"), "--recursion-limit", "5000"])
+    assert sys.getrecursionlimit() == limit
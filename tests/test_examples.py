@@ -1,9 +1,14 @@
+import base64
+import hashlib
 import os
 import sys
+from importlib.util import cache_from_source
 from itertools import chain, cycle
 from pathlib import Path
+from shutil import copytree, ignore_patterns
 from subprocess import CalledProcessError
 from typing import Iterable
+from zipfile import ZipFile
 
 import pytest
 
@@ -26,19 +31,32 @@ def invalid_examples():
     return [str(f.relative_to(INVALID_EXAMPLES)) for f in INVALID_EXAMPLES.glob("*")]
 
 
-def coconut_files(path: Path) -> Iterable[Path]:
+def example_config(path: Path) -> CoconutConfig:
     cfg_path = path / "pyproject.toml"
     if cfg_path.exists():
-        cfg = CoconutConfig.from_file(cfg_path) or CoconutConfig()
-    else:
-        cfg = CoconutConfig()
+        return CoconutConfig.from_file(cfg_path) or CoconutConfig()
+    return CoconutConfig()
+
 
+def coconut_files(path: Path) -> Iterable[Path]:
+    cfg = example_config(path)
     for src in cfg.src:
         src_path = path / src
         for p in src_path.glob("**/*.coco"):
             yield p.relative_to(src_path)
 
 
+def bytecode_files(path: Path) -> Iterable[Path]:
+    cfg = example_config(path)
+    if cfg.bytecode:
+        for file in coconut_files(path):
+            for level in cfg.optimize:
+                pyc = cache_from_source(
+                    str(file.with_suffix(".py")), optimization=level or ""
+                )
+                yield Path(pyc)
+
+
 def other_files(path: Path) -> Iterable[Path]:
     src_path = path / "src"
     for p in src_path.glob("**/*"):
@@ -98,6 +116,7 @@ def test_valid_examples(example, set_debug, monkeypatch):
     distribution_files = {_norm(p) for p in list_zip(distibutions[0])}
     files = {_norm(p.with_suffix(".py")) for p in coconut_files(path)}
     files |= {_norm(p) for p in other_files(path)}
+    files |= {_norm(p) for p in bytecode_files(path)}
     try:
         assert distribution_files >= files
     except AssertionError:
@@ -113,6 +132,44 @@ def test_valid_examples(example, set_debug, monkeypatch):
         assert not f.endswith(".coco")
 
 
+def test_stream_wheel(tmp_path, monkeypatch):
+    path = tmp_path / "with-bytecode"
+    copytree(EXAMPLES / "with-bytecode", path, ignore=ignore_patterns("build", "dist"))
+    pyproject = (path / "pyproject.toml").read_text()
+    pyproject = pyproject.replace(
+        '"setuptools.build_meta"', '"setuptools_coconut.build_meta"'
+    )
+    (path / "pyproject.toml").write_text(pyproject + "stream_wheel = true\n")
+    prepare_project(path)
+    build_project(path, monkeypatch, False)
+
+    wheel = next(path.glob("dist/*.whl"))
+    files = {_norm(p.with_suffix(".py")) for p in coconut_files(path)}
+    files |= {_norm(p) for p in chain(other_files(path), bytecode_files(path))}
+    files.add("with_bytecode/__coconut__.py")
+    with ZipFile(wheel) as z:
+        names = z.namelist()
+        assert len(names) == len(set(names))
+        assert set(names) >= files
+        record_name = next(n for n in names if n.endswith(".dist-info/RECORD"))
+        record = z.read(record_name).decode().splitlines()
+        hashes = {r.split(",")[0]: r.split(",")[1] for r in record}
+        for name in files:
+            digest = base64.urlsafe_b64encode(hashlib.sha256(z.read(name)).digest())
+            assert hashes[name] == "sha256=" + digest.rstrip(b"=").decode()
+        # Written by bdist_wheel itself (the archive is not rewritten afterwards)
+        data = z.getinfo("with_bytecode/data/text.txt")
+        streamed = z.getinfo("with_bytecode/factorial.py")
+        assert streamed.external_attr == data.external_attr
+        assert names.index(streamed.filename) < names.index(record_name)
+
+    # Generated files are not copied by setuptools
+    lib = path / "build/lib/with_bytecode"
+    assert (lib / "data/text.txt").exists()
+    assert not (lib / "factorial.py").exists()
+    assert not (lib / "__pycache__").exists()
+
+
 @pytest.mark.parametrize(
     "example, set_debug", zip(invalid_examples(), cycle([False, True]))
 )
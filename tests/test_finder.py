@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+from textwrap import dedent
+
+import pytest
+
+from setuptools_coconut import finder
+
+HEAVY_MODULES = [
+    "importlib.metadata",
+    "pydantic",
+    "tomli",
+    "setuptools_coconut.api",
+    "setuptools_coconut.config",
+]
+
+SCRIPT = """\
+import json, sys
+before = set(sys.modules)
+from setuptools_coconut.finder import compiled_files
+files = list(compiled_files("."))
+print(json.dumps({"files": files, "imported": sorted(set(sys.modules) - before)}))
+"""
+
+
+def run_finder(cwd):
+    cmd = [sys.executable, "-c", SCRIPT]
+    return json.loads(subprocess.check_output(cmd, cwd=str(cwd)))
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        "",
+        '[build-system]\nrequires = ["setuptools"]\n',
+        "[tool.black]\nline-length = 88\n",
+    ],
+)
+def test_no_heavy_imports(pyproject, contents):
+    pyproject.write_text(contents)
+    result = run_finder(pyproject.parent)
+    assert result["files"] == []
+    assert not set(HEAVY_MODULES) & set(result["imported"])
+
+
+def test_may_have_config(pyproject):
+    assert not finder.may_have_config(str(pyproject))
+    assert not finder.may_have_config(str(pyproject.parent / "missing.toml"))
+    pyproject.write_text(dedent('[tool.coconut]\nsrc = ["src"]\n'))
+    assert finder.may_have_config(str(pyproject))
+
+
+def test_compiled_files(pyproject, monkeypatch):
+    pyproject.write_text("[tool.coconut]\n")
+    monkeypatch.chdir(pyproject.parent)
+    monkeypatch.setattr("setuptools_coconut.api.compiled_files", lambda _: ["a.py"])
+    assert list(finder.compiled_files()) == ["a.py"]
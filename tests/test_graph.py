@@ -0,0 +1,59 @@
+from textwrap import dedent
+
+from setuptools_coconut.graph import dependents, module_name, parse_imports
+
+
+def test_module_name():
+    assert module_name("pkg/__init__.coco") == ("pkg", True)
+    assert module_name("pkg/sub/mod.coconut") == ("pkg.sub.mod", False)
+    assert module_name("mod.pyi.coco", "pkg") == ("pkg.mod", False)
+
+
+def test_parse_imports():
+    source = """\
+    import os, pkg.a as a
+    from typing import List
+    from . import b, c as see
+    from .sub.d import *
+    from .. import e  # beyond the top-level package
+    from .f import (
+        g,
+        h as i,
+    )
+    def fn() =
+        import pkg.j
+        pkg.j.k |> print
+    """
+    imports = parse_imports(dedent(source), "pkg.mod", False)
+    assert imports == [
+        "os",
+        "pkg",
+        "pkg.a",
+        "pkg.b",
+        "pkg.c",
+        "pkg.f",
+        "pkg.f.g",
+        "pkg.f.h",
+        "pkg.j",
+        "pkg.sub.d",
+        "typing",
+        "typing.List",
+    ]
+
+    imports = parse_imports("from .mod import x\n", "pkg.sub", True)
+    assert imports == ["pkg.sub.mod", "pkg.sub.mod.x"]
+
+
+def test_dependents():
+    imports = {
+        "a.coco": [],
+        "b.coco": ["a"],
+        "c.coco": ["b", "os"],
+        "d.coco": ["os"],
+        "e.coco": ["c", "e"],  # cycles are fine
+    }
+    modules = {k[0]: k for k in imports}
+    assert dependents(imports, modules, {"a.coco"}) == {"b.coco", "c.coco", "e.coco"}
+    assert dependents(imports, modules, {"c.coco"}) == {"e.coco"}
+    assert dependents(imports, modules, {"d.coco"}) == set()
+    assert dependents(imports, modules, {"a.coco", "b.coco"}) == {"c.coco", "e.coco"}
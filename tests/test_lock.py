@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import threading
+import time
+from textwrap import dedent
+
+from setuptools_coconut.lock import build_lock
+
+BUILD = """
+import sys
+from setuptools_coconut import api
+from setuptools_coconut.config import CoconutConfig
+
+def engine(args):
+    with open(sys.argv[2], "a") as f:
+        f.write("compiled\\n")
+    return api.ENGINES["inprocess"](args)
+
+api.ENGINES["recorded"] = engine
+config = CoconutConfig(dest="build", engine="inprocess")
+config = config.copy(update={"engine": "recorded"})
+api.compile(sys.argv[1], config)
+"""
+
+
+def test_reentrant(tmp_path):
+    events = []
+
+    def other_thread():
+        with build_lock(str(tmp_path)):
+            events.append("other")
+
+    with build_lock(str(tmp_path)) as lock:
+        with build_lock(str(tmp_path)) as inner:
+            assert inner is lock
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        time.sleep(0.1)
+        events.append("first")
+    thread.join()
+    assert events == ["first", "other"]
+
+
+def test_concurrent_builds(tmp_path):
+    pkg = tmp_path / "src/pkg"
+    pkg.mkdir(parents=True)
+    (pkg / "__init__.coco").write_text("")
+    (pkg / "mod.coco").write_text("def square(x) = x ** 2\n")
+    log = tmp_path / "compilations.log"
+    script = tmp_path / "build.py"
+    script.write_text(dedent(BUILD))
+
+    cmd = [sys.executable, str(script), str(tmp_path), str(log)]
+    processes = [subprocess.Popen(cmd) for _ in range(3)]
+    assert [p.wait() for p in processes] == [0, 0, 0]
+    assert log.read_text().splitlines() == ["compiled"]  # Only one process compiles
+    assert (tmp_path / "build/src/pkg/mod.py").exists()
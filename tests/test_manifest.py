@@ -0,0 +1,128 @@
+from pathlib import Path
+
+from setuptools_coconut.manifest import (
+    HEADER_FILE,
+    Manifest,
+    coconut_files,
+    dest_file,
+    manifest_file,
+    signature,
+)
+
+from .helpers import mkfile
+
+
+def test_dest_file():
+    assert dest_file("pkg/mod.coco") == "pkg/mod.py"
+    assert dest_file("pkg/mod.coc") == "pkg/mod.py"
+    assert dest_file("pkg/mod.pyi.coco") == "pkg/mod.pyi"
+
+
+def test_manifest_file():
+    assert manifest_file("state", "src") == str(Path("state/src.json"))
+    assert manifest_file("state", "a/b/") == str(Path("state/a_b.json"))
+
+
+def test_coconut_files(tmp_path):
+    expected = [
+        mkfile(tmp_path / "pkg/__init__.coco"),
+        mkfile(tmp_path / "pkg/mod.coconut"),
+    ]
+    mkfile(tmp_path / "pkg/data.txt")
+    mkfile(tmp_path / "pkg/.hidden/mod.coco")
+    assert sorted(coconut_files(str(tmp_path))) == sorted(expected)
+
+
+def test_stale(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "build"
+    state = tmp_path / "state.json"
+    files = [mkfile(src / "a.coco", "x = 1"), mkfile(src / "b.coco", "y = 2")]
+    sig = signature(["--target", "3.6"])
+
+    manifest = Manifest.load(str(state), str(src), str(dest), sig)
+    assert [f for f, _ in manifest.stale(files)] == files
+    for _, output in manifest.stale(files):
+        mkfile(Path(output))
+    manifest.commit()
+    manifest.save()
+
+    # Nothing changed
+    manifest = Manifest.load(str(state), str(src), str(dest), sig)
+    assert manifest.stale(files) == []
+
+    # Only modified files are stale
+    mkfile(src / "b.coco", "y = 30")
+    manifest = Manifest.load(str(state), str(src), str(dest), sig)
+    assert manifest.stale(files) == [(files[1], str(dest / "b.py"))]
+
+    # Missing outputs are stale
+    (dest / "a.py").unlink()
+    manifest = Manifest.load(str(state), str(src), str(dest), sig)
+    assert [f for f, _ in manifest.stale(files)] == files
+
+
+def test_signature_change(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "build"
+    state = tmp_path / "state.json"
+    files = [mkfile(src / "a.coco", "x = 1")]
+    mkfile(dest / "a.py")
+
+    def load(*opts):
+        return Manifest.load(str(state), str(src), str(dest), signature(list(opts)))
+
+    manifest = load("--target", "3.6")
+    manifest.stale(files)
+    manifest.commit()
+    manifest.save()
+
+    assert load("--target", "3.6").stale(files) == []
+    assert len(load("--target", "3.8").stale(files)) == 1
+    assert len(load("--target", "3.6", "--force").stale(files)) == 1
+
+
+def test_outputs(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "build"
+    files = [
+        mkfile(src / "pkg/__init__.coco"),
+        mkfile(src / "pkg/mod.coco"),
+        mkfile(src / "other/mod.coco"),
+    ]
+    manifest = Manifest(str(tmp_path / "m.json"), str(src), str(dest), {})
+    for _, output in manifest.stale(files):
+        mkfile(Path(output))
+    mkfile(dest / "pkg" / HEADER_FILE)  # coconut creates it for top-level packages
+    manifest.commit()
+    assert manifest.outputs() == [
+        str(dest / "other/mod.py"),
+        str(dest / "pkg" / HEADER_FILE),
+        str(dest / "pkg/__init__.py"),
+        str(dest / "pkg/mod.py"),
+    ]
+
+
+def test_dependents(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "build"
+    files = [
+        mkfile(src / "pkg/__init__.coco"),
+        mkfile(src / "pkg/base.coco", "x = 1"),
+        mkfile(src / "pkg/uses.coco", "from .base import x"),
+        mkfile(src / "pkg/star.coco", "from pkg.base import *"),
+        mkfile(src / "pkg/deep.coco", "import pkg.uses"),
+    ]
+    manifest = Manifest(str(tmp_path / "m.json"), str(src), str(dest), {})
+    for _, output in manifest.stale(files):
+        mkfile(Path(output))
+
+    def stale(*opts):
+        state = str(tmp_path / "-".join(opts or ["default"]))
+        manifest = Manifest.load(state, str(src), str(dest), signature(list(opts)))
+        manifest.stale(files)
+        manifest.commit()
+        manifest.save()
+        mkfile(src / "pkg/base.coco", f"x = {len(opts) + 10}")
+        manifest = Manifest.load(state, str(src), str(dest), signature(list(opts)))
+        return [Path(f).name for f, _ in manifest.stale(files)]
+
+    # Without mypy, the outputs don't depend on the imported modules
+    assert stale() == ["base.coco"]
+    assert stale("--mypy") == ["base.coco", "deep.coco", "star.coco", "uses.coco"]
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+
+from setuptools_coconut import api, runtime
+from setuptools_coconut.config import CoconutConfig
+
+SCRIPT = """
+import sys
+import pkg.sub.mod
+assert "__coconut__" not in sys.modules
+assert pkg.sub.mod.count(10) == 10
+try:
+    pkg.sub.mod.first([])
+except pkg.sub.mod.MatchError:
+    pass
+import lone
+print(pkg.sub.mod.MatchError.__module__)
+"""
+
+
+def mkproject(tmp_path):
+    pkg = tmp_path / "src/pkg"
+    (pkg / "sub").mkdir(parents=True)
+    (pkg / "__init__.coco").write_text("")
+    (pkg / "sub/__init__.coco").write_text("")
+    code = """\
+    def count(n, acc=0) = count(n - 1, acc + 1) if n else acc
+    def first([x] + _) = x
+    """
+    (pkg / "sub/mod.coco").write_text(code.replace("    ", ""))
+    (tmp_path / "src/lone.coco").write_text("y = 1 |> (+)$(1)\n")
+
+
+def test_relative_imports():
+    hash_ = "# __coconut_hash__ = 0x2636ab1b\n"
+    header = "from __future__ import generator_stop\nimport sys as _coconut_sys\n"
+    loader = (
+        "_coconut_file_dir = _coconut_os.path.dirname(__file__)\n"
+        "_coconut_sys.path.insert(0, _coconut_file_dir)\n"
+        "from __coconut__ import *\n"
+        "from __coconut__ import _coconut, _coconut_tail_call\n"
+        "_coconut_sys.path.pop(0)\n"
+    )
+    code = runtime.relative_imports(hash_ + header + loader + "x = 1\n", 1)
+    assert code == (
+        header
+        + "from ..__coconut__ import *\n"
+        + "from ..__coconut__ import _coconut, _coconut_tail_call\n"
+        + "x = 1\n"
+    )
+    standalone = hash_ + header + "x = 1\n"
+    assert runtime.relative_imports(standalone, 0) == standalone
+
+
+def test_shared_runtime(tmp_path):
+    mkproject(tmp_path)
+    config = CoconutConfig(src=["src"], dest="build", engine="inprocess")
+    api.compile(str(tmp_path), config)
+    out = tmp_path / "build/src"
+    sizes = {f: f.stat().st_size for f in out.glob("**/*.py")}
+
+    shared = config.copy(update={"shared_runtime": True})
+    api.compile(str(tmp_path), shared)
+    mod = (out / "pkg/sub/mod.py").read_text()
+    assert "from ..__coconut__ import *" in mod
+    assert "_coconut_sys.path" not in mod
+    assert "_coconut_sys.path" in (out / "lone.py").read_text()  # Not in a package
+    header = out / "pkg/__coconut__.py"
+    assert header.stat().st_size == sizes[header]
+    assert sum(f.stat().st_size for f in sizes) < sum(sizes.values())
+
+    cmd = [sys.executable, "-c", SCRIPT]
+    proc = subprocess.run(cmd, cwd=str(out), capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == "pkg.__coconut__"
+
+    # The original loader is restored when the option is disabled
+    api.compile(str(tmp_path), config)
+    assert (out / "pkg/sub/mod.py").stat().st_size == sizes[out / "pkg/sub/mod.py"]
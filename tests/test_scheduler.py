@@ -0,0 +1,73 @@
+from pathlib import Path
+from subprocess import CalledProcessError
+
+import pytest
+
+from setuptools_coconut import api, scheduler
+from setuptools_coconut.config import CoconutConfig
+from setuptools_coconut.engine import run_inprocess
+
+OPTS = ["--target", "3.6", "-j", "sys", "--strict", "--quiet"]
+
+
+def mkproject(tmp_path: Path):
+    src = tmp_path / "src/pkg"
+    src.mkdir(parents=True)
+    (src / "__init__.coco").write_text("")
+    for i in range(4):
+        body = "".join(f"def f{j}(x) = x + {j}\n" for j in range(i * 20 + 1))
+        (src / f"mod{i}.coco").write_text(body)
+    return src
+
+
+def test_schedule(tmp_path):
+    src = mkproject(tmp_path)
+    pairs = [(str(f), f"{f}.py") for f in sorted(src.glob("*.coco"))]
+    order = [Path(s).name for s, _ in scheduler.schedule(pairs)]
+    assert order == [
+        "mod3.coco",
+        "mod2.coco",
+        "mod1.coco",
+        "mod0.coco",
+        "__init__.coco",
+    ]
+
+
+def test_single_process():
+    assert scheduler.single_process(OPTS) == [*OPTS[:3], "0", *OPTS[4:]]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_same_output(tmp_path, workers):
+    src = mkproject(tmp_path)
+    run_inprocess([str(src), str(tmp_path / "expected"), *OPTS])
+    expected = {p.name: p.read_text() for p in (tmp_path / "expected").glob("*.py")}
+
+    out = tmp_path / "build/pkg"
+    pairs = [(str(f), str(out / f"{f.stem}.py")) for f in src.glob("*.coco")]
+    scheduler.compile_files(pairs, OPTS, workers)
+    assert {p.name: p.read_text() for p in out.glob("*.py")} == expected
+
+
+def test_errors(tmp_path):
+    src = mkproject(tmp_path)
+    (src / "mod1.coco").write_text("def f(x) = )\n")
+    out = tmp_path / "build/pkg"
+    pairs = [(str(f), str(out / f"{f.stem}.py")) for f in src.glob("*.coco")]
+    with pytest.raises(CalledProcessError) as exc:
+        scheduler.compile_files(pairs, OPTS, 2)
+    assert str(src / "mod1.coco") in exc.value.cmd
+    assert (out / "mod3.py").exists()  # Other files are still compiled
+
+
+def test_compile_manifests(tmp_path, monkeypatch):
+    mkproject(tmp_path)
+    recorded = []
+    monkeypatch.setattr(scheduler, "compile_files", lambda *a: recorded.append(a))
+    monkeypatch.setitem(api.ENGINES, "subprocess", pytest.fail)
+
+    config = CoconutConfig(dest="build", scheduler=True, processes=3)
+    api.compile(str(tmp_path), config)
+    ((pairs, _, workers),) = recorded
+    assert len(pairs) == 5
+    assert workers == 3
@@ -0,0 +1,56 @@
+import sys
+from subprocess import CalledProcessError
+from threading import Thread
+
+import pytest
+
+from setuptools_coconut import engine, server
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Unix sockets")
+
+
+def fake_compiler(args):
+    if "invalid" in args:
+        raise CalledProcessError(1, args, "CoconutSyntaxError")
+    return "compiled: " + " ".join(args)
+
+
+@pytest.fixture
+def running_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "run_inprocess", fake_compiler)
+    path = str(tmp_path / "server.sock")
+    with server.create(path) as srv:
+        thread = Thread(target=srv.serve_forever)
+        thread.start()
+        try:
+            yield path
+        finally:
+            srv.shutdown()
+            thread.join()
+
+
+def test_request(running_server):
+    assert server.is_running(running_server)
+    assert server.request(["a", "b"], running_server) == "compiled: a b"
+    with pytest.raises(CalledProcessError) as exc:
+        server.request(["invalid"], running_server)
+    assert "CoconutSyntaxError" in exc.value.output
+
+
+def test_already_running(running_server):
+    with pytest.raises(OSError):
+        server.create(running_server)
+
+
+def test_version_mismatch(running_server):
+    msg = {"args": ["a", "b"], "cwd": ".", "coconut": "0.0.0"}
+    with pytest.raises(server.ServerUnavailable):
+        server._send(msg, running_server)
+
+
+def test_fallback(tmp_path, monkeypatch):
+    path = str(tmp_path / "server.sock")
+    assert not server.is_running(path)
+    monkeypatch.setenv(server.SOCKET_ENV_VAR, path)
+    monkeypatch.setattr(engine, "run_subprocess", fake_compiler)
+    assert engine.run_server(["a", "b"]) == "compiled: a b"
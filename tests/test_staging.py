@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from setuptools_coconut import staging
+from setuptools_coconut.api import OtherFiles
+
+
+@pytest.mark.parametrize("strategy", list(staging.STRATEGIES))
+def test_strategies(tmp_path, strategy):
+    orig, dest = tmp_path / "orig.txt", tmp_path / "dest.txt"
+    orig.write_text("hello")
+    try:
+        staging.STRATEGIES[strategy](str(orig), str(dest))
+    except OSError:  # pragma: no cover
+        pytest.skip(f"{strategy!r} not supported")
+    assert dest.read_text() == "hello"
+    assert dest.is_symlink() is (strategy == "symlink")
+    assert staging.in_sync(str(orig), str(dest))
+
+    if strategy in ("reflink", "copy"):
+        orig.write_text("hello world")
+        assert not staging.in_sync(str(orig), str(dest))
+
+
+def test_fallback(tmp_path, monkeypatch):
+    def unsupported(*_):
+        raise OSError("not supported")
+
+    monkeypatch.setitem(staging.STRATEGIES, "reflink", unsupported)
+    monkeypatch.setitem(staging.STRATEGIES, "hardlink", unsupported)
+    for i in range(10):
+        (tmp_path / f"src/pkg/data{i}.txt").parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / f"src/pkg/data{i}.txt").write_text(str(i))
+
+    other = OtherFiles(str(tmp_path), "src", staging="reflink")
+    files = list(other.link_or_copy(str(tmp_path / "build")))
+    assert len(files) == 10
+    for file in files:
+        assert not os.path.islink(file)
+        assert open(file).read() == file[-5]
+    assert other._unsupported == {"reflink", "hardlink"}
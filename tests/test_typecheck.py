@@ -0,0 +1,140 @@
+import sys
+from subprocess import CalledProcessError
+
+import pytest
+
+from setuptools_coconut import api, cli, typecheck
+from setuptools_coconut.config import SKIP_TYPECHECK_ENV_VAR, CoconutConfig
+
+
+def test_cli_args():
+    args = CoconutConfig(mypy=True).as_cli_args()
+    assert "--mypy" in args
+    assert "--line-numbers" not in args
+
+    args = CoconutConfig(mypy=True, mypy_mode="cache").as_cli_args()
+    assert "--mypy" not in args
+    assert "--line-numbers" in args
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError) as exc:
+        CoconutConfig(mypy=True, mypy_mode="eventually")
+    assert "mypy_mode should be one of" in str(exc.value).replace("`", "")
+
+
+@pytest.mark.parametrize("mode", ["cache", "daemon"])
+def test_command(tmp_path, mode):
+    config = CoconutConfig(dest="build", mypy=True, mypy_mode=mode, target="3.8")
+    cmd = typecheck.command(str(tmp_path), config, ["a.py"])
+    state_dir = str(tmp_path / "build/.setuptools-coconut")
+    assert cmd[0] == sys.executable
+    assert "--python-version" in cmd  # Chosen by coconut, based on the target
+    assert cmd[cmd.index("--cache-dir") + 1].startswith(state_dir)
+    assert cmd[-1] == "a.py"
+    assert ("mypy.dmypy" in cmd) is (mode == "daemon")
+
+
+def test_daemon_not_available(tmp_path, monkeypatch):
+    monkeypatch.setattr(typecheck, "find_spec", lambda _: None)
+    config = CoconutConfig(mypy=True, mypy_mode="daemon")
+    assert typecheck.mode(config) == "cache"
+    assert "mypy.dmypy" not in typecheck.command(str(tmp_path), config, ["a.py"])
+
+
+def test_typecheck(tmp_path, monkeypatch):
+    pytest.importorskip("mypy")
+    pkg = tmp_path / "src/pkg"
+    pkg.mkdir(parents=True)
+    (pkg / "__init__.coco").write_text("")
+    (pkg / "a.coco").write_text("def f(x: int) -> int = x + 1\n")
+    (pkg / "b.coco").write_text("from .a import f\ny: str = f(2)\n")
+    config = CoconutConfig(
+        dest="build", mypy=True, mypy_mode="cache", engine="inprocess"
+    )
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(CalledProcessError) as exc:
+        api.compile(str(tmp_path), config)
+    assert 'variable has type "str"' in exc.value.output
+    assert (tmp_path / "build/.setuptools-coconut/mypy").is_dir()
+    # Compilation is not repeated, but the type check is
+    assert (tmp_path / "build/src/pkg/b.py").exists()
+    with pytest.raises(CalledProcessError) as exc:
+        api.compile(str(tmp_path), config)
+    assert 'variable has type "str"' in exc.value.output
+
+
+def fake_mypy(code):
+    def _command(project_root, config, files):
+        return [sys.executable, "-c", f"print({len(files)}); raise SystemExit({code})"]
+
+    return _command
+
+
+def test_background(tmp_path, monkeypatch):
+    config = CoconutConfig(dest="build", mypy=True, mypy_mode="cache")
+    monkeypatch.setattr(typecheck, "command", fake_mypy(0))
+    typecheck.start(str(tmp_path), config, ["a.py", "b.py", "__coconut__.py"])
+    typecheck.start(str(tmp_path), config, [])  # Nothing to check
+    typecheck.start(str(tmp_path), config, ["c.py"])
+    assert [o.strip() for o in typecheck.collect()] == ["2", "1"]
+    assert typecheck.collect() == []
+
+    monkeypatch.setattr(typecheck, "command", fake_mypy(1))
+    typecheck.start(str(tmp_path), config, ["a.py"])
+    with pytest.raises(CalledProcessError):
+        typecheck.collect()
+    assert (tmp_path / "build/.setuptools-coconut/typecheck.log").exists()
+
+
+def test_check_command(tmp_path, monkeypatch):
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.coconut]\ndest = "build"\nengine = "inprocess"\n'
+    )
+    (tmp_path / "src/pkg").mkdir(parents=True)
+    (tmp_path / "src/pkg/__init__.coco").write_text("x = 1\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(api, "discover_root", lambda: str(tmp_path))
+
+    config = CoconutConfig.from_file(tmp_path / "pyproject.toml")
+    api.compile(str(tmp_path), config)
+    output = tmp_path / "build/src/pkg/__init__.py"
+    mtime = output.stat().st_mtime_ns
+    (tmp_path / "src/pkg/mod.py").write_text("y = 2\n")
+
+    calls = []
+
+    def command(project_root, config, files):
+        calls.append((typecheck.state_path(project_root, config), sorted(files)))
+        return fake_mypy(0)(project_root, config, files)
+
+    monkeypatch.setattr(typecheck, "command", command)
+    cli.main(["check"])
+    # The outputs of the regular build are not replaced (different options)
+    assert output.stat().st_mtime_ns == mtime
+    check_dir = tmp_path / "build/.setuptools-coconut/check/src/pkg"
+    assert (check_dir / "__init__.py").exists()
+    assert (check_dir / "mod.py").exists()
+    # ... but the ``mypy`` cache and daemon are the ones of the project
+    [(state_dir, files)] = calls
+    assert state_dir == str(tmp_path / "build/.setuptools-coconut")
+    assert files == [str(check_dir / "__init__.py")]
+
+    monkeypatch.setattr(typecheck, "command", fake_mypy(1))
+    with pytest.raises(SystemExit) as exc:
+        cli.main(["check", "--mode", "daemon"])
+    assert exc.value.code == 1
+
+
+def test_skip(tmp_path, monkeypatch):
+    (tmp_path / "src/pkg").mkdir(parents=True)
+    (tmp_path / "src/pkg/__init__.coco").write_text("x = 1\n")
+    config = CoconutConfig(
+        dest="build", mypy=True, mypy_mode="cache", engine="inprocess"
+    )
+    monkeypatch.setattr(typecheck, "command", fake_mypy(1))
+    monkeypatch.setenv(SKIP_TYPECHECK_ENV_VAR, "1")
+    api.compile(str(tmp_path), config)  # e.g. when building the sdist
+    monkeypatch.delenv(SKIP_TYPECHECK_ENV_VAR)
+    with pytest.raises(CalledProcessError):
+        api.compile(str(tmp_path), config)
@@ -0,0 +1,144 @@
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+from setuptools_coconut import watch
+from setuptools_coconut.config import CoconutConfig
+
+from .test_api import mkpath, mksrc
+
+WATCHERS = [lambda roots, ignore: watch.PollingWatcher(roots, ignore, interval=0.01)]
+if sys.platform.startswith("linux"):
+    WATCHERS.append(watch.InotifyWatcher)
+
+
+def collect(watcher, expected, timeout=5):
+    changes = set()
+    deadline = time.monotonic() + timeout
+    while not expected <= changes and time.monotonic() < deadline:
+        changes |= watcher.changes(timeout=0.05)
+    return changes
+
+
+def save(path, contents):
+    """Similar to most editors: write a temporary file and rename it"""
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(contents)
+    os.replace(tmp, path)
+
+
+@pytest.mark.parametrize("create_watcher", WATCHERS)
+def test_watcher(tmp_path, create_watcher):
+    src = tmp_path / "src"
+    files = mksrc(tmp_path)
+    ignore = watch.ignore_patterns(["__pycache__"])
+    with create_watcher([str(src)], ignore) as watcher:
+        assert watcher.changes(timeout=0.05) == set()
+        time.sleep(0.01)  # Make sure mtime changes
+
+        save(files[1], "x = 42")
+        new = mkpath(src / "pkg/new/sub/data.json")
+        files[-1].unlink()
+        mkpath(src / "pkg/__pycache__/module1.pyc")
+        mkpath(src / "pkg/.hidden")
+        expected = {str(files[1]), str(new), str(files[-1])}
+        assert collect(watcher, expected) == expected
+
+
+@pytest.mark.parametrize("create_watcher", WATCHERS)
+def test_removed_dirs(tmp_path, create_watcher):
+    src = tmp_path / "src"
+    files = mksrc(tmp_path)
+    ignore = watch.ignore_patterns([])
+    with create_watcher([str(src)], ignore) as watcher:
+        shutil.rmtree(src / "pkg/subpkg1")
+        (src / "pkg/subpkg2").rename(tmp_path / "subpkg2")
+        expected = {str(f) for f in files[4:]}
+        assert collect(watcher, expected) == expected
+
+        # Changes in the directory that was moved away are not reported
+        time.sleep(0.01)  # Make sure mtime changes
+        (tmp_path / "subpkg2/pymodule.py").write_text("x = 42")
+        assert collect(watcher, set(), timeout=0.2) == set()
+
+
+def test_polling_checks_directories(tmp_path, monkeypatch):
+    mksrc(tmp_path)
+    watcher = watch.PollingWatcher([str(tmp_path / "src")], lambda _: False, 0)
+    checked = []
+    stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path: checked.append(path) or stat(path))
+    assert watcher.changes(timeout=0) == set()
+    monkeypatch.undo()
+    assert checked and all(os.path.isdir(p) for p in checked)  # Not the files
+
+
+def test_build(tmp_path, monkeypatch):
+    files = mksrc(tmp_path)
+    calls = []
+    monkeypatch.setattr(watch, "compile_manifests", lambda *args: calls.append(args))
+    config = CoconutConfig(dest="build", staging="copy")
+    session = watch.Watch(str(tmp_path), config)
+    session.build()
+    assert len(calls) == 1
+    build = tmp_path / "build/src"
+    assert (build / "pkg/subpkg1/data.txt").read_text() == files[5].read_text()
+
+    # Only other files changed
+    files[5].write_text("new data")
+    files[7].unlink()
+    bytecode = str(tmp_path / "src/pkg/__pycache__/a.pyc")
+    changes = {str(files[5]), str(files[7]), bytecode}
+    assert session.relevant(changes) == changes - {bytecode}
+    session.build(changes)
+    assert len(calls) == 1
+    assert (build / "pkg/subpkg1/data.txt").read_text() == "new data"
+    assert not (build / "pkg/subpkg2/pymodule.py").exists()
+
+    # Coconut files changed
+    new = mkpath(tmp_path / "src/pkg/module4.coco")
+    files[1].unlink()
+    session.build({str(new), str(files[1])})
+    assert len(calls) == 2
+    *_, sources = calls[-1]
+    assert str(new) in sources["src"] and str(files[1]) not in sources["src"]
+
+
+def test_build_error(tmp_path, monkeypatch, capsys):
+    files = mksrc(tmp_path)
+
+    def compile_manifests(*args):
+        raise FileNotFoundError(str(files[1]))
+
+    monkeypatch.setattr(watch, "compile_manifests", compile_manifests)
+    session = watch.Watch(str(tmp_path), CoconutConfig(dest="build"))
+    session.build({str(files[1])})  # Waits for the next change
+    assert str(files[1]) in capsys.readouterr().err
+
+
+def test_in_place(tmp_path):
+    files = mksrc(tmp_path)
+    session = watch.Watch(str(tmp_path), CoconutConfig())
+    generated = str(tmp_path / "src/pkg/module1.py")
+    assert session.relevant({generated, str(files[0])}) == {str(files[0])}
+
+
+def test_removed_source(tmp_path):
+    files = mksrc(tmp_path)
+    for file in files:
+        file.write_text("")
+    config = CoconutConfig(dest="build", engine="inprocess")
+    session = watch.Watch(str(tmp_path), config)
+    session.build()
+    output = tmp_path / "build/src/pkg/module3.py"
+    assert output.exists()
+
+    files[3].unlink()
+    session.build({str(files[3])})
+    assert not output.exists()
+    assert (tmp_path / "build/src/pkg/__coconut__.py").exists()
+    manifest = next((tmp_path / "build/.setuptools-coconut").glob("*.json"))
+    assert "pkg/module3.coco" not in manifest.read_text()